@@ -3,17 +3,85 @@ Contains routes for Flask app.
 
 Routes:
 - /: home page
-- /data_visualizations: interactive data visualizations based on name popularity
-- /random_name: generates random names based on user input (gender, number of names, surname)
+- /data_visualizations: interactive data visualizations based on name popularity and rank,
+with an optional chart comparing several names
+- /random_name: generates random names based on user input (gender, number of names, surname,
+weighting by births, seed, years, popularity); large requests are streamed as a CSV or JSON Lines download
 - /name_information: provides name information and world map visualization 
 displaying potential countries of origin
+- /autocomplete: JSON name suggestions for a partially typed name
+- /api/popularity: JSON births per year for one or more names
+- /api/nationality: JSON nationality predictions for a name
+- /metrics: request, upstream, and cache metrics in the Prometheus text format
 
+Set NAMES_CLIENT_CHARTS=1 to have browsers render the popularity charts and
+world map from the static chart templates in static/specs/ and the JSON API,
+instead of receiving full chart specs from the server.
+
+Set NAMES_PROFILING=1 to allow profiling single requests: a request sent with
+the header 'X-Profile: 1' is run under cProfile, the stats are saved to
+NAMES_PROFILE_DIR, and the file path is returned in the 'X-Profile-File' header.
 """
-from flask import Flask, request, render_template
+import os
+import json
+import time
+import secrets
+import tempfile
+import cProfile
+from flask import Flask, request, render_template, jsonify, url_for, g, Response
+import metrics
 import names
+import generate_names
+import name_index
+import name_search
 import visualizations
 
 app = Flask(__name__)
+app.config['CLIENT_CHARTS'] = os.environ.get('NAMES_CLIENT_CHARTS') == '1'
+app.config['PROFILING'] = os.environ.get('NAMES_PROFILING') == '1'
+app.config['PROFILE_DIR'] = os.environ.get('NAMES_PROFILE_DIR', tempfile.gettempdir())
+
+# most names /random_name shows on the page; larger requests are downloaded
+RANDOM_NAMES_PAGE_LIMIT = 1000
+# most names /random_name generates in one request
+RANDOM_NAMES_MAX = int(os.environ.get('NAMES_MAX_RANDOM_NAMES', 100000))
+
+
+@app.before_request
+def start_timer():
+    """
+    Record when the request started and start the profiler if it was asked for.
+    """
+    g.start_time = time.perf_counter()
+    g.profiler = None
+    if app.config['PROFILING'] and request.headers.get('X-Profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def record_request(response):
+    """
+    Record the request's latency by route, and save its profile if one was taken.
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        endpoint = request.endpoint or 'unmatched'
+        file_path = os.path.join(app.config['PROFILE_DIR'],
+                                 f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-"
+                                 f"{os.getpid()}-{id(profiler):x}.prof")
+        profiler.dump_stats(file_path)
+        response.headers['X-Profile-File'] = file_path
+
+    start_time = g.pop('start_time', None)
+    if start_time is not None:
+        # label by URL rule, not path, so every name shares one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - start_time, route=route,
+                                         method=request.method,
+                                         status=response.status_code)
+    return response
 
 
 @app.route('/')
@@ -37,6 +105,9 @@ def data_visualizations():
     template_data = {
         "chart_json": "{}",
         "chart_json2": "{}",
+        "chart_json3": "{}",
+        "rank_chart_json": "{}",
+        "client_charts": False,
     }
     if request.method == 'POST':
         name = request.form.get('name')
@@ -44,13 +115,27 @@ def data_visualizations():
         start_year = int(request.form.get('start_year'))
         end_year = int(request.form.get('end_year'))
 
-        df = names.popularity(name, gender, start_year, end_year)
+        if app.config['CLIENT_CHARTS']:
+            # the browser fetches /api/popularity and fills in the chart templates
+            template_data["client_charts"] = True
+        else:
+            # chart specs are cached, so repeat views skip pandas and Altair
+            (template_data["chart_json"],
+             template_data["chart_json2"]) = visualizations.popularity_charts_json(
+                name, gender, start_year, end_year)
 
-        line_chart = visualizations.simple_line_chart(df)
-        heatmap = visualizations.popularity_heatmap(df)
+        # rank history comes from the precomputed rank tables in the name index
+        if name_index.load_index() is not None:
+            template_data["rank_chart_json"] = visualizations.rank_chart_json(
+                name, gender, start_year, end_year)
 
-        template_data["chart_json"] = line_chart.to_json()
-        template_data["chart_json2"] = heatmap.to_json()
+        # overlay additional comma-separated names with the same gender
+        compare = [n.strip() for n in request.form.get(
+            'compare_names', default='').split(',') if n.strip()]
+        if compare:
+            pairs = [(n, gender) for n in [name] + compare]
+            template_data["chart_json3"] = visualizations.comparison_chart_json(
+                pairs, start_year, end_year)
 
     return render_template('data_visualizations.html', **template_data)
 
@@ -66,12 +151,90 @@ def random_name():
     """
     if request.method == 'POST':
         gender = request.form.get('gender', default='')
-        num_names = int(request.form.get('num_names', default=1))
+        num_names = request.form.get('num_names', default='1').strip()
+        num_names = int(num_names) if num_names.isdigit() else None
         include_surname = request.form.get('surname') == 'yes'
-        cur_names = [names.random_name(gender, include_surname)
-                     for _ in range(num_names)]
-        return render_template('generate_form.html', names=cur_names)
-    return render_template('generate_form.html')
+        weighted = request.form.get('weighting') == 'births'
+        output_format = request.form.get('output', default='')
+        seed = request.form.get('seed', default='').strip()
+
+        if num_names is None or not 1 <= num_names <= RANDOM_NAMES_MAX:
+            return generate_form(
+                error=f"Choose between 1 and {RANDOM_NAMES_MAX:,} names."), 400
+        if seed and not seed.isdigit():
+            return generate_form(error="The seed must be a whole number."), 400
+        # every request gets its own seeded generator; report the seed so the
+        # same names can be generated again
+        seed = int(seed) if seed else secrets.randbits(32)
+
+        # optional year and popularity filters; empty fields are not applied
+        filters = {}
+        for field in ('decade', 'start_year', 'end_year', 'top', 'min_births'):
+            value = request.form.get(field, default='').strip()
+            if value and not value.isdigit():
+                return generate_form(
+                    error="Years and popularity filters must be whole numbers."), 400
+            filters[field] = int(value) if value else None
+        decade = filters.pop('decade')
+        if decade is not None:
+            filters['start_year'], filters['end_year'] = decade, decade + 9
+        if 0 in (filters['top'], filters['min_births']):
+            return generate_form(
+                error="The top names and minimum births filters must be at least 1."), 400
+
+        try:
+            # check the gender and filters before a download starts
+            names.random_names(0, gender, **filters)
+        except ValueError as e:
+            return generate_form(error=str(e)), 400
+
+        if output_format in generate_names.FORMATS or num_names > RANDOM_NAMES_PAGE_LIMIT:
+            return stream_random_names(num_names, gender, include_surname, weighted,
+                                       output_format or 'csv', seed, filters)
+
+        cur_names = [name for chunk in names.iter_random_names(
+            num_names, gender, include_surname, weighted, seed,
+            chunk_size=generate_names.CHUNK_SIZE, **filters) for name in chunk]
+        return generate_form(names=cur_names, seed=seed)
+    return generate_form()
+
+
+def generate_form(**context):
+    """
+    Render the random name form with the range of years that have data.
+
+    output:
+        rendered 'generate_form.html' template
+    """
+    years = names.available_years()
+    return render_template(
+        'generate_form.html', max_names=RANDOM_NAMES_MAX,
+        first_year=years[0] if years else None, last_year=years[-1] if years else None,
+        decades=sorted({year // 10 * 10 for year in years}), **context)
+
+
+def stream_random_names(num_names, gender, surname, weighted, output_format, seed,
+                        filters):
+    """
+    Stream random names as a CSV or JSON Lines download, generated in chunks
+    so memory use stays flat for large requests. The names are the same as
+    `python generate_names.py` gives for the same seed.
+
+    output:
+        streamed Response
+    """
+    def generate():
+        yield generate_names.header(output_format)
+        for chunk in names.iter_random_names(num_names, gender, surname, weighted, seed,
+                                             chunk_size=generate_names.CHUNK_SIZE,
+                                             **filters):
+            yield generate_names.format_names(chunk, output_format)
+
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition':
+            f'attachment; filename=random_names-seed{seed}.{output_format}',
+        'X-Seed': str(seed)})
 
 
 @app.route('/name_information', methods=['GET', 'POST'])
@@ -86,7 +249,42 @@ def name_information():
           - 'spotify_data': first song title matching name from Spotify API
 
     """
+    if request.method == 'POST':
+        name = request.form.get('name', '')
+        gender = request.form.get('gender', '')
+
+        # get first and last names if provided
+        first, last = names.split_full_name(name)
+
+        # look up meaning, nationality, gender, and age concurrently
+        results = names.name_information(first, last, gender)
+
+        # ** Uncomment to display song matching name from Spotify API
+        # (requires SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET to be set)
+        # results["spotify_data"] = names.spotify_track(name)
+
+        template_data = name_info_template_data(
+            name, results, url_for('static', filename='world-110m.json'))
+    else:
+        template_data = name_info_template_data()
+    return render_template('name_info.html', **template_data)
+
+
+def name_info_template_data(name='', results=None,
+                            topology_url=visualizations.WORLD_TOPOLOGY_URL):
+    """
+    Build the 'name_info.html' template variables from name_information() results.
+    Shared by the sync route and the async one in asgi_app.py.
+
+    input:
+        name: string, name entered by the user
+        results: dictionary output of names.name_information(); default None (empty form)
+        topology_url: string, URL of the world map TopoJSON file; default the copy in static/
+    output:
+        dictionary of template variables
+    """
     template_data = {
+        "submitted_name": name,
         "name_meaning": "",
         "nationalize": [],
         "genderize": (),
@@ -94,25 +292,105 @@ def name_information():
         # ** Uncomment for Spotify API data
         # "spotify_data": {},
         "world_map_json": "{}",
+        "nationality_json": "[]",
     }
+    if results is None:
+        return template_data
 
-    if request.method == 'POST':
-        name = request.form.get('name', '')
-        gender = request.form.get('gender', '')
+    results = dict(results)
+    predictions = results.pop('nationality_predictions')
+    template_data.update(results)
 
-        # get first and last names if provided
-        first, last = names.split_full_name(name)
+    # display map if no errors with nationalize
+    if isinstance(predictions, list) and app.config['CLIENT_CHARTS']:
+        template_data["nationality_json"] = json.dumps(
+            visualizations.nationality_rows(predictions))
+    elif isinstance(predictions, list):
+        world_map = visualizations.create_nationalize_map(
+            predictions=predictions, topology_url=topology_url)
+        template_data["world_map_json"] = visualizations.chart_to_json(world_map)
+    return template_data
 
-        template_data["name_meaning"] = names.get_name_meaning(first, gender)
-        template_data["nationalize"] = names.get_formatted_nationality(last)
-        template_data["genderize"] = names.genderize(first)
-        template_data["agify"] = names.agify(first)
 
-        # ** Uncomment to display song matching name from Spotify API
-        # template_data["spotify_data"] = names.spotify_track(name)
+@app.route('/autocomplete')
+def autocomplete():
+    """
+    Route to suggest names as the user types.
 
-        # display map if no errors with nationalize
-        if isinstance(names.nationalize(last), list):
-            world_map = visualizations.create_nationalize_map(last)
-            template_data["world_map_json"] = world_map.to_json()
-    return render_template('name_info.html', **template_data)
+    Query parameters:
+    - q: partially typed name
+    - limit: maximum number of suggestions (default 10, at most 50)
+
+    Output:
+    - JSON object with the query and a list of matching names, most popular first
+    """
+    query = request.args.get('q', default='')
+    limit = min(request.args.get('limit', default=10, type=int), 50)
+    return jsonify(query=query, matches=name_search.autocomplete(query, limit))
+
+
+@app.route('/api/popularity')
+def api_popularity():
+    """
+    Route returning the number of births per year for one or more names.
+
+    Query parameters:
+    - name: first name; repeat to get several names
+    - gender: 'm' or 'f'
+    - start_year, end_year: range of years (default 1880 to the latest indexed year)
+
+    Output:
+    - JSON object with 'start_year', 'end_year', and a 'series' list holding
+      each name's gender and births for every year in the range
+    """
+    query_names = [n for n in request.args.getlist('name') if n.strip()]
+    gender = request.args.get('gender', default='').lower()
+    index = name_index.load_index()
+    start_year = request.args.get('start_year', default=1880, type=int)
+    end_year = request.args.get(
+        'end_year', default=index.last_year if index else 2023, type=int)
+
+    if not query_names or gender not in ('m', 'f') or start_year > end_year:
+        return jsonify(error="Provide at least one name, a gender of 'm' or 'f', "
+                             "and start_year <= end_year."), 400
+
+    df = names.popularity_many([(n, gender) for n in query_names], start_year, end_year)
+    series = [{'name': column.rsplit(' (', 1)[0], 'gender': gender,
+               'births': df[column].tolist()}
+              for column in df.columns if column != 'Year']
+    return jsonify(start_year=start_year, end_year=end_year, series=series)
+
+
+@app.route('/api/nationality')
+def api_nationality():
+    """
+    Route returning the predicted nationalities of a name from the Nationalize API.
+
+    Query parameters:
+    - name: last name (or first name if no last name is known)
+
+    Output:
+    - JSON object with the name and a 'predictions' list of numeric and
+      two-letter country codes, country names, and probabilities;
+      an 'error' message with status 404 (no data) or 502 (API failure) otherwise
+    """
+    name = request.args.get('name', default='').strip()
+    if not name:
+        return jsonify(error="Provide a name."), 400
+
+    predictions = names.nationalize(name)
+    if not isinstance(predictions, list):
+        status = 404 if predictions.startswith('Error:') else 502
+        return jsonify(name=name, error=predictions), status
+    return jsonify(name=name, predictions=visualizations.nationality_rows(predictions))
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Route exposing request, upstream, lookup, and cache metrics for Prometheus.
+
+    Output:
+    - metrics in the Prometheus text exposition format
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,104 @@
+"""
+Optional async (ASGI) serving mode: `uvicorn asgi_app:app` or `hypercorn asgi_app:app`
+
+The I/O-bound routes, /name_information and /api/nationality, are served by
+async Quart handlers using the lookups in async_names.py, so one worker can
+wait on many NameBerry and Nationalize/Genderize/Agify calls at once instead
+of holding a thread for each. Every other path is passed on to the sync Flask
+app in app.py, which remains the default way to serve the site.
+
+Requires the optional async dependencies: pip install -r requirements-async.txt
+"""
+import time
+import asyncio
+from quart import Quart, request, render_template, jsonify, url_for, g
+from asgiref.wsgi import WsgiToAsgi
+import app as sync_app
+import async_names
+import metrics
+import names
+import visualizations
+
+# paths handled by the async handlers below; everything else goes to app.py
+ASYNC_PATHS = {'/name_information', '/api/nationality'}
+
+quart_app = Quart(__name__)
+flask_app = WsgiToAsgi(sync_app.app)
+
+
+@quart_app.before_request
+async def start_timer():
+    """
+    Record when the request started.
+    """
+    g.start_time = time.perf_counter()
+
+
+@quart_app.after_request
+async def record_request(response):
+    """
+    Record the request's latency by route, like the sync app.
+    """
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_DURATION.observe(time.perf_counter() - g.start_time, route=route,
+                                     method=request.method,
+                                     status=response.status_code)
+    return response
+
+
+@quart_app.after_serving
+async def close_client():
+    """
+    Close the async HTTP client's connections on shutdown.
+    """
+    await async_names.close()
+
+
+@quart_app.route('/name_information', methods=['GET', 'POST'])
+async def name_information():
+    """
+    Async version of the /name_information route in app.py.
+    """
+    if request.method == 'POST':
+        form = await request.form
+        name = form.get('name', '')
+        gender = form.get('gender', '')
+
+        # get first and last names if provided
+        first, last = names.split_full_name(name)
+        results = await async_names.name_information(first, last, gender)
+
+        # building the map is CPU-bound, so keep it off the event loop
+        template_data = await asyncio.to_thread(
+            sync_app.name_info_template_data, name, results,
+            url_for('static', filename='world-110m.json'))
+    else:
+        template_data = sync_app.name_info_template_data()
+    return await render_template('name_info.html', **template_data)
+
+
+@quart_app.route('/api/nationality')
+async def api_nationality():
+    """
+    Async version of the /api/nationality route in app.py.
+    """
+    name = request.args.get('name', default='').strip()
+    if not name:
+        return jsonify(error="Provide a name."), 400
+
+    predictions = await async_names.nationalize(name)
+    if not isinstance(predictions, list):
+        status = 404 if predictions.startswith('Error:') else 502
+        return jsonify(name=name, error=predictions), status
+    return jsonify(name=name, predictions=visualizations.nationality_rows(predictions))
+
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point sending the async paths (and server lifespan events)
+    to the Quart app and every other request to the sync Flask app.
+    """
+    if scope['type'] == 'lifespan' or scope.get('path') in ASYNC_PATHS:
+        await quart_app(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
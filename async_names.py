@@ -0,0 +1,319 @@
+"""
+Async versions of the name lookups in names.py, used by the ASGI app (asgi_app.py).
+
+Requests go through one pooled httpx.AsyncClient with the same per-host rate
+limits, retry settings, metrics, and response cache as http_client.py, and
+answers are parsed into the same results and error messages as the sync
+lookups. Concurrent lookups of the same name share one upstream request, so
+a single worker can keep hundreds of lookups in flight.
+
+Requires the optional async dependencies: pip install -r requirements-async.txt
+"""
+import time
+import random
+import asyncio
+import functools
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+import httpx
+import http_client
+import metrics
+import names
+from cache import cache_key, ttl_for, response_cache
+
+_client = None
+
+
+def get_client():
+    """
+    Return the shared async client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        # the client ignores limits= when given a transport, so set them on the transport
+        _client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=http_client.POOL_SIZE * 5,
+                                max_keepalive_connections=http_client.POOL_SIZE),
+            # retry failed connections; retryable statuses are handled in request()
+            retries=http_client.RETRIES))
+    return _client
+
+
+async def close():
+    """
+    Close the shared async client and its connections.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_delay(response, attempt):
+    """
+    Seconds to wait before retrying a response: its Retry-After header if given,
+    otherwise exponential backoff with jitter, as urllib3 does for the sync client.
+    Waits are capped at http_client.MAX_RETRY_AFTER like the sync client's.
+
+    output:
+        float, or None if Retry-After asks for a longer wait than the cap
+        (the response should be returned without retrying)
+    """
+    retry_after = response.headers.get('Retry-After')
+    delay = None
+    if retry_after:
+        try:
+            delay = max(float(retry_after), 0)
+        except ValueError:
+            try:
+                delay = max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+        if delay is not None and delay > http_client.MAX_RETRY_AFTER:
+            return None
+    if delay is None:
+        delay = (http_client.BACKOFF_FACTOR * 2 ** attempt
+                 + random.uniform(0, http_client.BACKOFF_JITTER))
+    return min(delay, http_client.MAX_RETRY_AFTER)
+
+
+async def _wait_for_rate_limit(limiter):
+    """
+    Wait without blocking the event loop until the limiter allows a request.
+
+    output:
+        seconds spent waiting
+    """
+    start = time.monotonic()
+    while True:
+        wait = limiter.try_acquire()
+        if not wait:
+            return time.monotonic() - start
+        await asyncio.sleep(wait)
+
+
+async def request(method, url, **kwargs):
+    """
+    Send a request through the shared async client, waiting for the host's
+    rate limit and retrying responses with status 429 or a transient 5xx.
+
+    input:
+        method: string, HTTP method
+        url: string
+        kwargs: passed on to httpx.AsyncClient.request()
+    output:
+        httpx.Response
+    """
+    host = urlsplit(url).hostname or ''
+    limiter = http_client.limiter_for(url)
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        for attempt in range(http_client.RETRIES + 1):
+            if limiter is not None:
+                metrics.RATE_LIMIT_WAIT.observe(await _wait_for_rate_limit(limiter),
+                                                host=host)
+            response = await get_client().request(method, url, **kwargs)
+            status = response.status_code
+            if status not in http_client.RETRY_STATUSES or attempt == http_client.RETRIES:
+                return response
+            delay = _retry_delay(response, attempt)
+            if delay is None:
+                return response
+            metrics.UPSTREAM_RETRIES.inc(host=host)
+            await asyncio.sleep(delay)
+    except httpx.TimeoutException:
+        status = 'timeout'
+        raise
+    except httpx.TransportError:
+        status = 'connection_error'
+        raise
+    finally:
+        metrics.UPSTREAM_DURATION.observe(time.perf_counter() - start,
+                                          host=host, status=status)
+
+
+async def get(url, **kwargs):
+    """
+    Send a GET request through the shared async client.
+    """
+    return await request('GET', url, **kwargs)
+
+
+def async_cached(source):
+    """
+    Decorator caching a coroutine lookup's answers under the given source name,
+    like cache.cached(). Concurrent calls with the same arguments await one
+    shared upstream request, which finishes (and is cached) even if they give up.
+    """
+    def decorator(func):
+        in_flight = {}
+
+        async def fetch(key, args):
+            value = await func(*args)
+            ttl = ttl_for(source, value)
+            if ttl is not None:
+                response_cache.set(source, key, value, ttl)
+            return value
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            start = time.perf_counter()
+            key = cache_key(source, args)
+            hit, value = response_cache.get(source, key)
+            if not hit:
+                task = in_flight.get(key)
+                if task is None:
+                    task = in_flight[key] = asyncio.ensure_future(fetch(key, args))
+                    task.add_done_callback(lambda _: in_flight.pop(key, None))
+                value = await asyncio.shield(task)
+            ttl = ttl_for(source, value)
+            result = 'ok' if not isinstance(value, str) else (
+                'no_data' if ttl is not None else 'error')
+            metrics.LOOKUP_DURATION.observe(time.perf_counter() - start, source=source,
+                                            cache='hit' if hit else 'miss', result=result)
+            return value
+        return wrapper
+    return decorator
+
+
+@async_cached('nameberry')
+async def get_name_meaning(name, gender):
+    """
+    Async version of names.get_name_meaning().
+    """
+    name = name.capitalize()
+    try:
+        r = await get(names._nameberry_url(name, gender),
+                      headers=names.NAMEBERRY_HEADERS, timeout=10)
+        r.raise_for_status()
+    except httpx.TimeoutException:
+        return "The request timed out."
+    except httpx.HTTPStatusError as e:
+        # only a missing page means NameBerry has no data; other statuses are
+        # transient failures and must not be cached as "no information"
+        status = e.response.status_code if e.response is not None else None
+        if status == 404:
+            return f"Error: No information found on NameBerry for {name}"
+        return f"NameBerry is unavailable right now (HTTP {status})."
+    except httpx.HTTPError as e:
+        return f"An error occurred while making the request: {e}"
+
+    # parsing the page is CPU-bound, so keep it off the event loop
+    return await asyncio.to_thread(names._parse_name_meaning, r.text, name)
+
+
+@async_cached('nationalize')
+async def nationalize(name):
+    """
+    Async version of names.nationalize().
+    """
+    try:
+        response = await get("https://api.nationalize.io",
+                             params={'name': name}, timeout=10)
+        response.raise_for_status()
+    except httpx.TimeoutException:
+        return "The request to the Nationalize API timed out."
+    except httpx.HTTPStatusError as e:
+        return f"HTTP error occurred: {e}"
+    except httpx.HTTPError as e:
+        return f"An error occurred (Nationalize API): {e}"
+
+    return names._parse_nationalize(response.json())
+
+
+@async_cached('genderize')
+async def genderize(name):
+    """
+    Async version of names.genderize().
+    """
+    try:
+        response = await get("https://api.genderize.io",
+                             params={'name': name}, timeout=10)
+        response.raise_for_status()
+    except httpx.TimeoutException:
+        return "The request to the Genderize API timed out."
+    except httpx.HTTPStatusError as e:
+        return f"HTTP error occurred: {e}"
+    except httpx.HTTPError as e:
+        return f"An error occurred (Genderize API): {e}"
+
+    return names._parse_genderize(response.json())
+
+
+@async_cached('agify')
+async def agify(name):
+    """
+    Async version of names.agify().
+    """
+    try:
+        response = await get("https://api.agify.io",
+                             params={'name': name}, timeout=10)
+        response.raise_for_status()
+    except httpx.TimeoutException:
+        return "The request to the Agify API timed out."
+    except httpx.HTTPStatusError as e:
+        return f"HTTP error occurred: {e}"
+    except httpx.HTTPError as e:
+        return f"An error occurred (Agify API): {e}"
+
+    return names._parse_agify(response.json())
+
+
+@async_cached('spotify')
+async def spotify_track(name):
+    """
+    Async version of names.spotify_track().
+    """
+    # the token is shared with the sync lookups and refreshed rarely
+    token, error = await asyncio.to_thread(names.spotify_token.get)
+    if error:
+        return error
+
+    try:
+        search_response = await get(
+            names.SPOTIFY_SEARCH_URL, headers={"Authorization": f"Bearer {token}"},
+            params={"q": name, "type": "track", "limit": 1}, timeout=10)
+        if search_response.status_code == 401:
+            names.spotify_token.invalidate()
+        search_response.raise_for_status()
+    except httpx.TimeoutException:
+        return "The request timed out."
+    except httpx.HTTPError as e:
+        return f"An error occurred during search: {e}"
+
+    return names._parse_spotify_track(search_response.json(), name)
+
+
+async def name_information(first_name, last_name, gender, deadline=names.LOOKUP_DEADLINE):
+    """
+    Async version of names.name_information(): run the NameBerry, Nationalize,
+    Genderize, and Agify lookups concurrently with one overall deadline.
+
+    output:
+        dictionary with 'name_meaning', 'nationalize', 'genderize', and 'agify' results
+        and the raw Nationalize output as 'nationality_predictions'
+    """
+    lookups = {
+        'name_meaning': get_name_meaning(first_name, gender),
+        'nationality_predictions': nationalize(last_name),
+        'genderize': genderize(first_name),
+        'agify': agify(first_name),
+    }
+    tasks = {key: asyncio.ensure_future(lookup) for key, lookup in lookups.items()}
+    await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results = {}
+    for key, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            results[key] = "The request timed out."
+        elif task.exception() is not None:
+            results[key] = f"An error occurred: {task.exception()}"
+        else:
+            results[key] = task.result()
+
+    # format the single Nationalize response for display
+    results['nationalize'] = names.get_formatted_nationality(
+        predictions=results['nationality_predictions'])
+    return results
@@ -0,0 +1,308 @@
+"""
+Benchmark the data, name generation, and visualization hot paths.
+
+A synthetic names_files/ tree in the SSA format (yobYYYY.txt files and a
+Census-style surnames.csv) is generated from a fixed seed in a temporary
+directory, so runs need no network and are comparable across machines.
+Each case reports throughput, latency percentiles, and peak memory
+(measured with tracemalloc on a separate call), and the results are saved as
+JSON. Pass --compare with an earlier results file to flag regressions.
+
+Usage:
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+
+SYLLABLES = ['ka', 'li', 'ma', 'ro', 'na', 'el', 'an', 'is', 'ja', 'de', 'vi', 'or',
+             'sa', 'th', 'en', 'ly', 'mi', 'ar', 'co', 'be', 'la', 'ri', 'to', 'ne']
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+YEAR_RANGES = (1, 10, 50, 144)
+COUNTRY_PREDICTIONS = [
+    {'country_id': 'US', 'probability': 0.31},
+    {'country_id': 'GB', 'probability': 0.22},
+    {'country_id': 'IE', 'probability': 0.12},
+    {'country_id': 'AU', 'probability': 0.08},
+    {'country_id': 'CA', 'probability': 0.05},
+]
+
+
+def _name_pool(rng, size):
+    """
+    Make `size` distinct pronounceable names from random syllables.
+    """
+    pool = set()
+    while len(pool) < size:
+        parts = rng.choice(SYLLABLES, size=rng.integers(2, 5))
+        pool.add(''.join(parts).capitalize())
+    return sorted(pool)
+
+
+def generate_data(data_dir, first_year=1880, last_year=2023, names_per_year=2000, seed=0):
+    """
+    Write a synthetic SSA-format dataset.
+
+    Births follow a Zipf-like curve within each year, and the number of names
+    grows from a quarter of names_per_year in the first year to names_per_year
+    in the last, like the real files.
+
+    input:
+        data_dir: string, directory to write yobYYYY.txt files and surnames.csv to
+        first_year, last_year: int
+        names_per_year: int, names per sex in the last year
+        seed: int
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    pool = np.array(_name_pool(rng, names_per_year * 3), dtype=object)
+    span = max(last_year - first_year, 1)
+
+    for year in range(first_year, last_year + 1):
+        count = int(names_per_year * (0.25 + 0.75 * (year - first_year) / span))
+        with open(os.path.join(data_dir, f'yob{year}.txt'), 'w', newline='') as f:
+            for sex in ('F', 'M'):
+                picks = pool[rng.choice(pool.size, size=count, replace=False)]
+                births = np.sort((200000 / np.arange(1, count + 1) ** 1.1).astype(np.int64)
+                                 + rng.integers(5, 50, size=count))[::-1]
+                f.writelines(f'{name},{sex},{b}\r\n' for name, b in zip(picks, births))
+
+    surnames = _name_pool(rng, names_per_year * 5)
+    counts = (2500000 / np.arange(1, len(surnames) + 1) ** 0.9).astype(np.int64) + 100
+    with open(os.path.join(data_dir, 'surnames.csv'), 'w', newline='') as f:
+        f.write('Table 1. Surnames Occurring 100 or More Times,,\n,,\nSURNAME,RANK,COUNT\n')
+        f.writelines(f'{name.upper()},{rank},"{count:,}"\n'
+                     for rank, (name, count) in enumerate(zip(surnames, counts), 1))
+        f.write('Footnotes,,\nSource: synthetic,,\n,,\n')
+
+
+def measure(func, repeat, items=1):
+    """
+    Time repeated calls of a function, then measure its peak memory on one more call.
+
+    input:
+        func: function without arguments
+        repeat: int, number of timed calls (after one warm-up call)
+        items: int, items produced per call, for items-per-second throughput
+    output:
+        dictionary of statistics (seconds, items per second, and bytes)
+    """
+    func()
+    latencies = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = latencies.sum()
+    return {
+        'calls': repeat,
+        'items_per_call': items,
+        'calls_per_second': repeat / total if total else float('inf'),
+        'items_per_second': repeat * items / total if total else float('inf'),
+        'mean': float(latencies.mean()),
+        'p50': float(np.percentile(latencies, 50)),
+        'p90': float(np.percentile(latencies, 90)),
+        'p99': float(np.percentile(latencies, 99)),
+        'max': float(latencies.max()),
+        'peak_memory_bytes': peak,
+    }
+
+
+def benchmark_cases(repeat):
+    """
+    Build the benchmark cases; the data modules must be imported after
+    NAMES_DATA_DIR points at the synthetic data.
+
+    input:
+        repeat: int, base number of timed calls per case
+    output:
+        list of (case name, function, repeat, items per call) tuples
+    """
+    import names
+    import name_index
+    import visualizations
+
+    files = name_index.year_files()
+    last_year = max(files)
+    # query the 50 most common girls' names of the last year in turn
+    popular = [n for n, sex, _ in name_index.read_year_file(files[last_year])
+               if sex == 'F'][:50]
+    choices = itertools.cycle(popular)
+
+    cases = []
+    for years in YEAR_RANGES:
+        cases.append((f'popularity[{years}y]',
+                      lambda years=years: names.popularity(
+                          next(choices), 'f', last_year - years + 1, last_year),
+                      repeat, 1))
+
+    for n in BATCH_SIZES:
+        calls = max(repeat // max(n // 100, 1), 5)
+        cases.append((f'random_names[n={n}]',
+                      lambda n=n: names.random_names(n, surname=True), calls, n))
+        cases.append((f'random_names_weighted[n={n}]',
+                      lambda n=n: names.random_names(n, surname=True, weighted=True),
+                      calls, n))
+        # the last decade's top 100 names; should cost the same as unfiltered draws
+        cases.append((f'random_names_filtered[n={n}]',
+                      lambda n=n: names.random_names(n, surname=True,
+                                                     start_year=last_year - 9,
+                                                     end_year=last_year, top=100),
+                      calls, n))
+        cases.append((f'random_surnames[n={n}]',
+                      lambda n=n: names.random_surnames(n), calls, n))
+    cases.append(('random_name', lambda: names.random_name('', True), repeat, 1))
+    cases.append(('random_surname', names.random_surname, repeat, 1))
+
+    cases.append(('get_country_codes',
+                  lambda: names.get_country_codes(COUNTRY_PREDICTIONS), repeat * 10,
+                  len(COUNTRY_PREDICTIONS)))
+
+    df = names.popularity(popular[0], 'f', last_year - YEAR_RANGES[-1] + 1, last_year)
+    chart_repeat = max(repeat // 10, 5)
+    for builder in (visualizations.simple_line_chart, visualizations.popularity_heatmap):
+        chart = builder(df)
+        cases.append((f'{builder.__name__}', lambda builder=builder: builder(df),
+                      chart_repeat, 1))
+        cases.append((f'{builder.__name__}.to_json', lambda chart=chart: chart.to_json(),
+                      chart_repeat, 1))
+    return cases
+
+
+def environment():
+    """
+    Describe the machine and library versions the benchmark ran with.
+    """
+    import pandas as pd
+    import altair as alt
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'altair': alt.__version__,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare median latencies with a baseline run.
+
+    input:
+        results, baseline: dictionaries of case name to statistics
+        threshold: float, relative slowdown reported as a regression (e.g. 0.1)
+    output:
+        list of (case name, baseline p50, new p50, ratio, regressed) tuples
+    """
+    rows = []
+    for case, stats in results.items():
+        if case in baseline:
+            ratio = stats['p50'] / baseline[case]['p50'] if baseline[case]['p50'] else 1.0
+            rows.append((case, baseline[case]['p50'], stats['p50'], ratio,
+                         ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="JSON file to write results to (default: benchmark_results.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slowdown reported as a regression (default: 0.1)")
+    parser.add_argument('--repeat', type=int, default=200,
+                        help="timed calls per case (default: 200)")
+    parser.add_argument('--names-per-year', type=int, default=2000,
+                        help="names per sex in the last synthetic year (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-index', action='store_true',
+                        help="benchmark the file-scan fallback instead of the compiled index")
+    parser.add_argument('--data-dir', help="keep the synthetic data in this directory")
+    parser.add_argument('--only', help="run only cases whose name contains this text")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='names-benchmark-')
+    try:
+        start = time.perf_counter()
+        generate_data(data_dir, names_per_year=args.names_per_year, seed=args.seed)
+        print(f"generated data in {time.perf_counter() - start:.1f} s: {data_dir}")
+
+        # the data modules read NAMES_DATA_DIR when first imported
+        os.environ['NAMES_DATA_DIR'] = data_dir
+        import name_index
+        results = {}
+        if not args.no_index:
+            results['build_index'] = measure(name_index.build_index, 1)
+
+        for case, func, repeat, items in benchmark_cases(args.repeat):
+            if args.only and args.only not in case:
+                continue
+            results[case] = measure(func, repeat, items)
+
+        # every year file was generated above, so a miss means the data modules
+        # read another directory and the timings are meaningless
+        import metrics
+        if metrics.MISSING_YEAR_FILES.value():
+            print(f"error: year files missing from {data_dir}; results not written",
+                  file=sys.stderr)
+            return 1
+
+        print(f"{'case':<40} {'items/s':>12} {'p50 ms':>9} {'p90 ms':>9} "
+              f"{'p99 ms':>9} {'peak KiB':>10}")
+        for case, stats in results.items():
+            print(f"{case:<40} {stats['items_per_second']:>12,.0f} "
+                  f"{stats['p50'] * 1000:>9.3f} {stats['p90'] * 1000:>9.3f} "
+                  f"{stats['p99'] * 1000:>9.3f} {stats['peak_memory_bytes'] / 1024:>10,.0f}")
+
+        report = {
+            'environment': environment(),
+            'settings': {'repeat': args.repeat, 'names_per_year': args.names_per_year,
+                         'seed': args.seed, 'index': not args.no_index},
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)['results']
+            regressions = 0
+            print(f"\n{'case':<40} {'old p50 ms':>11} {'new p50 ms':>11} {'ratio':>7}")
+            for case, old, new, ratio, regressed in compare(results, baseline, args.threshold):
+                regressions += regressed
+                print(f"{case:<40} {old * 1000:>11.3f} {new * 1000:>11.3f} {ratio:>7.2f}"
+                      + ('  REGRESSION' if regressed else ''))
+            return 1 if regressions else 0
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
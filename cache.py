@@ -0,0 +1,243 @@
+"""
+Cache responses from the name lookup APIs (Nationalize, Genderize, Agify, NameBerry, Spotify).
+
+Answers are kept in a bounded in-memory LRU tier and, if NAMES_CACHE_DB
+points to a file, in an SQLite tier that survives restarts.
+Each source has its own time-to-live; "no data" answers (error messages
+starting with 'Error:') are cached for a shorter time, while timeouts and
+other transient errors are never cached.
+Every lookup through @cached is timed in metrics.LOOKUP_DURATION.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict, defaultdict
+import metrics
+
+DAY = 24 * 60 * 60
+
+# seconds to keep a successful answer from each source
+TTLS = {
+    'nationalize': 30 * DAY,
+    'genderize': 30 * DAY,
+    'agify': 30 * DAY,
+    'nameberry': 7 * DAY,
+    'spotify': 7 * DAY,
+}
+DEFAULT_TTL = DAY
+NEGATIVE_TTL = DAY
+
+CACHE_SIZE = int(os.environ.get('NAMES_CACHE_SIZE', 4096))
+CACHE_DB = os.environ.get('NAMES_CACHE_DB', '')
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache holding at most maxsize entries,
+    each with its own expiry time.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return (True, value) for a live entry, otherwise (False, None).
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        """
+        Store a value for ttl seconds, evicting the least recently used entry if full.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk cache tier storing JSON-encoded values in an SQLite table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, expires_at REAL, value TEXT)')
+
+    def get(self, key):
+        """
+        Return (True, value, expiry time) for a live entry, otherwise (False, None, None).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expires_at, value FROM responses WHERE key = ?',
+                (key,)).fetchone()
+        if row is None or row[0] < time.time():
+            return False, None, None
+        return True, json.loads(row[1]), row[0]
+
+    def set(self, key, value, ttl):
+        """
+        Store a value for ttl seconds.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                (key, time.time() + ttl, json.dumps(value)))
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
+
+
+class ResponseCache:
+    """
+    Two-tier response cache with per-source hit and miss counters.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, path=CACHE_DB):
+        self.memory = LRUCache(maxsize)
+        self.disk = SQLiteCache(path) if path else None
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def _count(self, source, outcome):
+        with self._lock:
+            self._counts[source][outcome] += 1
+
+    def get(self, source, key):
+        """
+        Look up a key in the memory tier, then the disk tier.
+
+        output:
+            tuple of (hit: boolean, value)
+        """
+        hit, value = self.memory.get(key)
+        if hit:
+            self._count(source, 'memory_hits')
+            return True, value
+        if self.disk is not None:
+            hit, value, expires_at = self.disk.get(key)
+            if hit:
+                self._count(source, 'disk_hits')
+                # promote to the memory tier for the rest of the entry's lifetime
+                self.memory.set(key, value, expires_at - time.time())
+                return True, value
+        self._count(source, 'misses')
+        return False, None
+
+    def set(self, source, key, value, ttl):
+        """
+        Store a value in both tiers.
+        """
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def stats(self):
+        """
+        Return hit and miss counters for each source.
+
+        output:
+            dictionary mapping source to a dictionary of counters
+        """
+        with self._lock:
+            return {source: dict(counts) for source, counts in self._counts.items()}
+
+    def clear(self):
+        """
+        Remove every entry from both tiers.
+        """
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+response_cache = ResponseCache()
+
+
+def ttl_for(source, value):
+    """
+    Return how long to cache a value from a source, or None if it must not be cached.
+
+    Lookups return error messages as strings: 'Error: ...' messages mean the
+    source has no data for the name (e.g. a NameBerry 404) and are cached
+    briefly, while any other string is a transient failure.
+    """
+    if isinstance(value, str):
+        return NEGATIVE_TTL if value.startswith('Error:') else None
+    return TTLS.get(source, DEFAULT_TTL)
+
+
+def cache_key(source, args):
+    """
+    Build a cache key from a source name and case-insensitive lookup arguments.
+    """
+    return f"{source}:" + '|'.join(str(arg).strip().lower() for arg in args)
+
+
+def cached(source):
+    """
+    Decorator caching a lookup function's answers under the given source name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            start = time.perf_counter()
+            key = cache_key(source, args)
+            hit, value = response_cache.get(source, key)
+            if not hit:
+                value = func(*args)
+            ttl = ttl_for(source, value)
+            if not hit and ttl is not None:
+                response_cache.set(source, key, value, ttl)
+            result = 'ok' if not isinstance(value, str) else (
+                'no_data' if ttl is not None else 'error')
+            metrics.LOOKUP_DURATION.observe(time.perf_counter() - start, source=source,
+                                            cache='hit' if hit else 'miss', result=result)
+            return value
+        return wrapper
+    return decorator
+
+
+def stats():
+    """
+    Return hit and miss counters for each source.
+    """
+    return response_cache.stats()
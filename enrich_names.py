@@ -0,0 +1,116 @@
+"""
+Enrich a CSV file of names with predicted gender, age, and nationality.
+
+Rows are read and written in chunks, and each chunk is looked up with the
+multi-name Genderize, Agify, and Nationalize endpoints (up to 10 names per request).
+
+Usage:
+    python enrich_names.py roster.csv enriched.csv --column name
+"""
+import argparse
+import csv
+import sys
+from itertools import islice
+import names
+
+ENRICHED_COLUMNS = [
+    'predicted_gender', 'gender_probability',
+    'predicted_age',
+    'predicted_nationality', 'nationality_probability',
+]
+
+
+def enrich_rows(rows, column):
+    """
+    Add predicted gender, age, and nationality to a list of CSV rows.
+
+    input:
+        rows: list of dictionaries (csv.DictReader rows)
+        column: string, name of the column holding first or full names
+    output:
+        list of dictionaries with the ENRICHED_COLUMNS added
+    """
+    # blank cells (and short rows, which DictReader fills with None) are not
+    # looked up and keep empty prediction columns
+    looked_up = [row for row in rows if (row.get(column) or '').strip()]
+    for row in rows:
+        row.update(dict.fromkeys(ENRICHED_COLUMNS, ''))
+    if not looked_up:
+        return rows
+
+    split_names = [names.split_full_name(row[column]) for row in looked_up]
+    firsts = [first for first, _ in split_names]
+    lasts = [last for _, last in split_names]
+
+    genders = names.genderize_batch(firsts)
+    ages = names.agify_batch(firsts)
+    nationalities = names.nationalize_batch(lasts)
+
+    for row, gender, age, nationality in zip(looked_up, genders, ages, nationalities):
+        # API errors are strings; keep them in the first column of that prediction
+        if isinstance(gender, str):
+            row['predicted_gender'], row['gender_probability'] = gender, ''
+        else:
+            row['predicted_gender'], row['gender_probability'] = gender[0], gender[1]
+
+        row['predicted_age'] = age
+
+        if isinstance(nationality, list):
+            top = names.get_formatted_nationality(predictions=nationality[:1])
+            row['predicted_nationality'], row['nationality_probability'] = top[0]
+        else:
+            row['predicted_nationality'], row['nationality_probability'] = nationality, ''
+    return rows
+
+
+def enrich_csv(input_file, output_file, column='name', chunk_size=1000):
+    """
+    Stream a CSV of names through enrich_rows() chunk by chunk.
+
+    input:
+        input_file: file object opened for reading
+        output_file: file object opened for writing
+        column: string, name of the column holding first or full names
+        chunk_size: int, number of rows looked up together
+    output:
+        int, number of rows written
+    """
+    csv_reader = csv.DictReader(input_file)
+    if column not in (csv_reader.fieldnames or []):
+        raise ValueError(f"Column '{column}' not found in input file.")
+
+    csv_writer = csv.DictWriter(
+        output_file, fieldnames=csv_reader.fieldnames + ENRICHED_COLUMNS)
+    csv_writer.writeheader()
+
+    total = 0
+    while chunk := list(islice(csv_reader, chunk_size)):
+        csv_writer.writerows(enrich_rows(chunk, column))
+        total += len(chunk)
+    return total
+
+
+def main(argv=None):
+    """
+    Main function.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help="CSV file of names ('-' for stdin)")
+    parser.add_argument('output', help="enriched CSV file ('-' for stdout)")
+    parser.add_argument('--column', default='name',
+                        help="column holding first or full names (default: name)")
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="rows looked up together (default: 1000)")
+    args = parser.parse_args(argv)
+
+    input_file = sys.stdin if args.input == '-' else open(
+        args.input, newline='', encoding='utf-8-sig')
+    output_file = sys.stdout if args.output == '-' else open(
+        args.output, 'w', newline='', encoding='utf-8')
+    with input_file, output_file:
+        total = enrich_csv(input_file, output_file, args.column, args.chunk_size)
+    print(f"Enriched {total} names.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,95 +5,513 @@ Gathers and saves locally
 - number of Social Security card holders each year.
 """
 
-import zipfile
 import os
+import sys
+import json
+import time
+import zlib
+import struct
+import shutil
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from csv import writer
+from urllib.parse import urlsplit
 import requests
+import http_client
+import metrics
 from bs4 import BeautifulSoup
 import pandas as pd
+import name_index
 
+SSA_NAMES_URL = "https://www.ssa.gov/oact/babynames/names.zip"
+SURNAMES_URL = "https://www2.census.gov/topics/genealogy/2010surnames/Names_2010Census_Top1000.xlsx"
 
-def download_zip_files():
+# optional SHA-256 checksums to verify downloads against
+SSA_NAMES_SHA256 = os.environ.get('NAMES_SSA_SHA256', '')
+SURNAMES_SHA256 = os.environ.get('NAMES_SURNAMES_SHA256', '')
+
+CHUNK_SIZE = 64 * 1024
+# (connect, read) timeouts in seconds; the read timeout applies between chunks
+DOWNLOAD_TIMEOUT = (10, 60)
+# times a dropped download is resumed before giving up
+MAX_RESUMES = 5
+
+ZIP_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+ZIP_LOCAL_SIGNATURE = 0x04034b50
+ZIP_DESCRIPTOR_SIGNATURE = 0x08074b50
+
+
+class ChecksumError(Exception):
+    """
+    Raised when a downloaded file does not match its expected checksum.
+    """
+
+
+def iter_download(url, offset=0, digest=None, validators=None, info=None):
+    """
+    Stream a download in chunks, resuming with an HTTP Range request
+    if the connection drops part way through.
+
+    input:
+        url: string
+        offset: int, number of bytes already downloaded
+        digest: hashlib object updated with every chunk; default None
+        validators: dictionary with the 'etag' and/or 'last_modified' of a
+            previous download, sent as a conditional request; default None
+        info: dictionary filled in with the response 'status', 'etag',
+            and 'last_modified'; default None
+    output:
+        generator of bytes chunks, starting at offset;
+        nothing if the server answers 304 Not Modified
+    """
+    info = {} if info is None else info
+    headers = {}
+    if validators and not offset:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    host = urlsplit(url).hostname or ''
+    resumes = 0
+    while True:
+        if offset:
+            headers = {'Range': f'bytes={offset}-'}
+            # only accept the range if the file has not changed in between
+            if info.get('etag') or info.get('last_modified'):
+                headers['If-Range'] = info.get('etag') or info['last_modified']
+        with http_client.get(url, headers=headers, stream=True,
+                             timeout=DOWNLOAD_TIMEOUT) as r:
+            if r.status_code == 304:
+                info['status'] = 304
+                return
+            if r.status_code == 416:
+                # the range starts at the end of the file: nothing left to fetch
+                return
+            r.raise_for_status()
+            if 'status' not in info:
+                info.update(status=r.status_code, etag=r.headers.get('ETag'),
+                            last_modified=r.headers.get('Last-Modified'))
+            elif r.status_code != 206 and info.get('etag') and \
+                    r.headers.get('ETag') != info['etag']:
+                raise ValueError(f"{url} changed while it was being downloaded")
+            # servers that ignore Range resend the whole file; skip what we have
+            skip = offset if r.status_code != 206 else 0
+            try:
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk, skip = chunk[dropped:], skip - dropped
+                        if not chunk:
+                            continue
+                    offset += len(chunk)
+                    metrics.DOWNLOAD_BYTES.inc(len(chunk), host=host)
+                    if digest is not None:
+                        digest.update(chunk)
+                    yield chunk
+                return
+            except (requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ConnectionError) as e:
+                resumes += 1
+                if resumes > MAX_RESUMES:
+                    raise
+                print(f"Download of {url} interrupted ({e}); resuming at byte {offset}.")
+
+
+def download_file(url, file_path, sha256='', validators=None, info=None):
+    """
+    Download a file to disk in chunks. A partial download left in
+    file_path + '.part' by an earlier run is resumed, not restarted.
+
+    input:
+        url: string
+        file_path: string
+        sha256: string, expected SHA-256 hex digest; default "" (not checked)
+        validators, info: see iter_download()
+    output:
+        SHA-256 hex digest of the downloaded file, or None if not modified
+    """
+    info = {} if info is None else info
+    part_path = file_path + '.part'
+    digest = hashlib.sha256()
+    offset = 0
+    if os.path.exists(part_path):
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(block)
+                offset += len(block)
+
+    with open(part_path, 'ab') as f:
+        for chunk in iter_download(url, offset, digest, validators, info):
+            f.write(chunk)
+
+    if info.get('status') == 304:
+        os.remove(part_path)
+        return None
+
+    checksum = digest.hexdigest()
+    if sha256 and checksum != sha256.lower():
+        os.remove(part_path)
+        raise ChecksumError(f"{url}: expected SHA-256 {sha256}, got {checksum}")
+    os.replace(part_path, file_path)
+    return checksum
+
+
+class _ByteStream:
+    """
+    Buffered reader over an iterator of bytes chunks.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def _fill(self, size):
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return
+            self._buffer += chunk
+
+    def read(self, size):
+        """
+        Read exactly size bytes, or fewer at the end of the stream.
+        """
+        self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read_some(self):
+        """
+        Read whatever is buffered (or the next chunk); b'' at the end of the stream.
+        """
+        self._fill(1)
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def unread(self, data):
+        """
+        Push bytes back to the front of the stream.
+        """
+        self._buffer[:0] = data
+
+
+def zipfile_error(message):
+    """
+    Build the exception raised for archives that can't be streamed.
+    """
+    return ValueError(f"Bad zip archive: {message}")
+
+
+def _member_chunks(stream, method, flags, compressed_size):
+    """
+    Yield the uncompressed contents of one zip member from the stream.
+    """
+    if method == 0:
+        if flags & 0x08:
+            raise zipfile_error("stored members without sizes can't be streamed")
+        remaining = compressed_size
+        while remaining:
+            data = stream.read(min(remaining, CHUNK_SIZE))
+            if not data:
+                raise zipfile_error("unexpected end of archive")
+            remaining -= len(data)
+            yield data
+    elif method == 8:
+        # deflate streams mark their own end, so sizes are not needed
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        while not decompressor.eof:
+            data = stream.read_some()
+            if not data:
+                raise zipfile_error("unexpected end of archive")
+            yield decompressor.decompress(data)
+        stream.unread(decompressor.unused_data)
+    else:
+        raise zipfile_error(f"unsupported compression method {method}")
+
+
+def _read_data_descriptor(stream):
+    """
+    Read the data descriptor that follows a member written with flag bit 3
+    (its signature is optional) and return the member's CRC-32.
+    """
+    field = struct.unpack('<I', stream.read(4))[0]
+    if field == ZIP_DESCRIPTOR_SIGNATURE:
+        field = struct.unpack('<I', stream.read(4))[0]
+    stream.read(8)
+    return field
+
+
+def extract_zip_stream(chunks, output_dir, known=None):
+    """
+    Extract the members of a zip archive as it streams in, without
+    saving the archive itself. Each member is written to a temporary
+    file and moved into place once its CRC-32 has been checked.
+
+    input:
+        chunks: iterator of bytes chunks of a zip archive
+        output_dir: string
+        known: dictionary mapping member name to the SHA-256 of a copy we
+            already have; members matching it are not written; default None
+    output:
+        tuple of (dictionary mapping member name to the SHA-256 hex digest of
+        its contents, list of the member names written to output_dir)
+    """
+    known = known or {}
+    stream = _ByteStream(chunks)
+    checksums = {}
+    written = []
+    while True:
+        header = stream.read(ZIP_LOCAL_HEADER.size)
+        if len(header) < ZIP_LOCAL_HEADER.size:
+            break
+        (signature, _, flags, method, _, _, crc, compressed_size, _,
+         name_length, extra_length) = ZIP_LOCAL_HEADER.unpack(header)
+        if signature != ZIP_LOCAL_SIGNATURE:
+            # reached the central directory: every member has been read
+            break
+        member = stream.read(name_length).decode('utf-8', 'replace')
+        stream.read(extra_length)
+
+        member_path = os.path.join(output_dir, os.path.basename(member))
+        tmp_path = member_path + '.tmp'
+        digest = hashlib.sha256()
+        member_crc = 0
+        with open(tmp_path, 'wb') as f:
+            for data in _member_chunks(stream, method, flags, compressed_size):
+                f.write(data)
+                digest.update(data)
+                member_crc = zlib.crc32(data, member_crc)
+
+        # members with a data descriptor store their CRC after the data
+        if flags & 0x08:
+            crc = _read_data_descriptor(stream)
+        if member_crc != crc:
+            os.remove(tmp_path)
+            raise zipfile_error(f"CRC mismatch in {member}")
+        checksum = digest.hexdigest()
+        if member.endswith('/') or known.get(os.path.basename(member)) == checksum:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, member_path)
+            written.append(os.path.basename(member))
+        if not member.endswith('/'):
+            checksums[os.path.basename(member)] = checksum
+    return checksums, written
+
+
+_manifest_lock = threading.Lock()
+
+
+def manifest_path():
     """
-    Download and unzip name files from SSA. 
+    Return the path of the manifest recording what has been downloaded.
     """
-    url = "https://www.ssa.gov/oact/babynames/names.zip"
-    zip_file_path = 'names.zip'
-    extract_file_path = 'names_files'
+    return os.path.join(name_index.DATA_DIR, 'manifest.json')
+
 
+def load_manifest():
+    """
+    Load the download manifest:
+    - 'sources': ETag, Last-Modified, and SHA-256 of each downloaded URL
+    - 'files': SHA-256, size, and modification time of each extracted file
+
+    output:
+        dictionary (empty sections if nothing has been downloaded yet)
+    """
     try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        return f"HTTP Error: {e}"
-    except requests.exceptions.Timeout:
-        return "The request timed out."
-    except requests.exceptions.RequestException as e:
-        return f"An error occurred while making the request: {e}"
+        with open(manifest_path(), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    manifest.setdefault('sources', {})
+    manifest.setdefault('files', {})
+    return manifest
 
-    os.makedirs(extract_file_path, exist_ok=True)
 
-    with open(zip_file_path, 'wb') as f:
-        f.write(r.content)
+def update_manifest(update):
+    """
+    Apply update(manifest) to the saved manifest; safe to call from
+    concurrent downloads.
+    """
+    with _manifest_lock:
+        manifest = load_manifest()
+        update(manifest)
+        tmp_path = manifest_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, manifest_path())
 
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_file_path)
 
-    os.remove(zip_file_path)
+def _file_record(file_path, checksum):
+    """
+    Describe an extracted file for the manifest.
+    """
+    stat = os.stat(file_path)
+    return {'sha256': checksum, 'size': stat.st_size, 'mtime': stat.st_mtime}
 
 
-def download_surnames():
+def _unchanged_files(manifest, data_dir):
     """
-    Download top 1000 surnames from US Census.
+    Return the manifest checksums of files still on disk exactly as we left them.
     """
+    known = {}
+    for file_name, record in manifest['files'].items():
+        try:
+            stat = os.stat(os.path.join(data_dir, file_name))
+        except FileNotFoundError:
+            continue
+        if stat.st_size == record['size'] and stat.st_mtime == record['mtime']:
+            known[file_name] = record['sha256']
+    return known
 
-    url = "https://www2.census.gov/topics/genealogy/2010surnames/Names_2010Census_Top1000.xlsx"
 
-    file_path = "surnames.xlsx"
-    output_dir = 'names_files'
-    output_file = 'surnames.csv'
-    output_path = os.path.join(output_dir, output_file)
+def download_zip_files(incremental=False):
+    """
+    Download and unzip name files from SSA.
+    The archive is extracted as it downloads and is never saved to disk.
+
+    input:
+        incremental: boolean; default False. If True, skip the download when
+            the archive has not changed since the last run (ETag/Last-Modified)
+            and only replace the files whose contents changed.
+    """
+    extract_file_path = name_index.DATA_DIR
+    staging_path = os.path.join(extract_file_path, '.staging')
+
+    manifest = load_manifest()
+    validators = manifest['sources'].get(SSA_NAMES_URL) if incremental else None
+    known = _unchanged_files(manifest, extract_file_path) if incremental else None
+
+    # a staging directory left by an interrupted run means files may have been
+    # moved into place without the manifest being updated, so re-extract everything
+    if os.path.isdir(staging_path):
+        print("Found files from an interrupted download; extracting every file.")
+        known = None
+        validators = None
+    shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+
+    digest = hashlib.sha256()
+    info = {}
+    try:
+        try:
+            checksums, changed = extract_zip_stream(
+                iter_download(SSA_NAMES_URL, digest=digest,
+                              validators=validators, info=info),
+                staging_path, known)
+        except requests.exceptions.HTTPError as e:
+            return f"HTTP Error: {e}"
+        except requests.exceptions.Timeout:
+            return "The request timed out."
+        except requests.exceptions.RequestException as e:
+            return f"An error occurred while making the request: {e}"
+        except ValueError as e:
+            return str(e)
+
+        if info.get('status') == 304:
+            print("SSA names archive is unchanged.")
+            return None
+
+        # only replace the existing files once the whole archive checks out
+        checksum = digest.hexdigest()
+        if SSA_NAMES_SHA256 and checksum != SSA_NAMES_SHA256.lower():
+            return f"Checksum mismatch for {SSA_NAMES_URL}: got {checksum}"
+        for file_name in changed:
+            os.replace(os.path.join(staging_path, file_name),
+                       os.path.join(extract_file_path, file_name))
+    finally:
+        # the staging directory only outlives a run that was killed outright
+        shutil.rmtree(staging_path, ignore_errors=True)
+    print(f"Updated {len(changed)} of {len(checksums)} SSA name files.")
+
+    def record(manifest):
+        manifest['sources'][SSA_NAMES_URL] = {
+            'etag': info.get('etag'),
+            'last_modified': info.get('last_modified'),
+            'sha256': checksum,
+        }
+        for file_name, file_checksum in checksums.items():
+            manifest['files'][file_name] = _file_record(
+                os.path.join(extract_file_path, file_name), file_checksum)
+    update_manifest(record)
+    return None
+
+
+def download_surnames(incremental=False):
+    """
+    Download top 1000 surnames from US Census.
+
+    input:
+        incremental: boolean; default False. If True, skip the download
+            when the workbook has not changed since the last run.
+    """
+    output_dir = name_index.DATA_DIR
+    file_path = os.path.join(output_dir, 'surnames.xlsx')
+    output_path = os.path.join(output_dir, 'surnames.csv')
 
     os.makedirs(output_dir, exist_ok=True)
 
+    validators = load_manifest()['sources'].get(SURNAMES_URL) if incremental else None
+    info = {}
     try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
+        checksum = download_file(SURNAMES_URL, file_path, SURNAMES_SHA256,
+                                 validators, info)
     except requests.exceptions.HTTPError as e:
         return f"HTTP Error: {e}"
     except requests.exceptions.Timeout:
         return "The request timed out."
     except requests.exceptions.RequestException as e:
         return f"An error occurred while making the request: {e}"
+    except ChecksumError as e:
+        return str(e)
 
-    with open(file_path, 'wb') as f:
-        f.write(r.content)
+    if checksum is None:
+        print("Census surnames file is unchanged.")
+        return None
 
     df = pd.read_excel(file_path)
     df.to_csv(output_path, index=False)
     os.remove(file_path)
 
+    def record(manifest):
+        manifest['sources'][SURNAMES_URL] = {
+            'etag': info.get('etag'),
+            'last_modified': info.get('last_modified'),
+            'sha256': checksum,
+        }
+    update_manifest(record)
+    return None
+
 
-def scrape_ssa():
+def scrape_ssa(incremental=False):
     """
     Scraps SSA website for data about 
     'Number of Social Security card holders 
     born in the U. S. by year of birth and sex.'
+
+    input:
+        incremental: boolean; accepted for consistency with the other
+            downloads, the page is always scraped in full
     """
 
     url = 'https://www.ssa.gov/oact/babynames/numberUSbirths.html'
 
-    output_file = "names_files/ssa_counts.csv"
+    output_file = os.path.join(name_index.DATA_DIR, 'ssa_counts.csv')
 
     try:
-        r = requests.get(url, timeout=10)
+        r = http_client.get(url, timeout=DOWNLOAD_TIMEOUT)
         r.raise_for_status()
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e}")
+        return f"HTTP Error: {e}"
     except requests.exceptions.Timeout:
-        print("The request timed out.")
+        return "The request timed out."
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while making the request: {e}")
+        return f"An error occurred while making the request: {e}"
 
     soup = BeautifulSoup(r.text, 'html.parser')
     table = soup.find("table")
@@ -110,17 +528,57 @@ def scrape_ssa():
                 female = columns[2].text.replace(',', '').strip()
                 total = columns[3].text.replace(',', '').strip()
                 csv_writer.writerow([year, male, female, total])
+    return None
+
+
+def compile_name_index(incremental=False):
+    """
+    Compile the downloaded annual name files into the
+    memory-mapped index used by names.popularity().
+
+    input:
+        incremental: boolean; default False. If True, only the years
+            whose files changed are re-read and updated in the index.
+    """
+    meta = name_index.update_index() if incremental else name_index.build_index()
+    print(f"Indexed {meta['num_keys']} names from "
+          f"{meta['first_year']} to {meta['last_year']}.")
 
 
-def main():
+def main(argv=None):
     """
     Main function.
     """
+    parser = argparse.ArgumentParser(description="Download the name datasets.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only fetch and re-index data that changed since the last run")
+    parser.add_argument('--metrics-file',
+                        help="write download timings and sizes to this file in the "
+                             "Prometheus text format")
+    args = parser.parse_args(argv)
 
-    download_zip_files()
-    download_surnames()
+    def run(download):
+        start = time.perf_counter()
+        error = download(args.incremental)
+        metrics.DOWNLOAD_DURATION.observe(time.perf_counter() - start,
+                                          source=download.__name__,
+                                          result='error' if error else 'ok')
+        return error
+
+    # the sources are independent, so fetch them at the same time
+    downloads = [download_zip_files, download_surnames]
     # ** Uncomment to download number of Social Security card holders by year and gender
-    # scrape_ssa()
+    # downloads.append(scrape_ssa)
+    with ThreadPoolExecutor(max_workers=len(downloads)) as executor:
+        errors = list(executor.map(run, downloads))
+
+    for download, error in zip(downloads, errors):
+        if error:
+            print(f"{download.__name__}: {error}", file=sys.stderr)
+
+    compile_name_index(args.incremental)
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Generate large numbers of random names offline, e.g. for test fixtures.
+
+Names are generated in chunks spread across worker processes and streamed
+to stdout or a file as CSV or JSON Lines, so memory use stays flat however
+many names are requested. Each chunk has its own seed spawned from one
+SeedSequence, so the same --seed and --chunk-size always give the same
+names, whatever the number of workers.
+
+Usage:
+    python generate_names.py 1000000 --surname --weighted --seed 42 -o names.csv
+    python generate_names.py 500 --gender f --format jsonl
+    python generate_names.py 500 --decade 1990 --top 100
+"""
+import os
+import io
+import csv
+import sys
+import json
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import names
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 10000
+
+
+def header(output_format):
+    """
+    Return the text written before the first name in a format.
+    """
+    return 'name\r\n' if output_format == 'csv' else ''
+
+
+def format_names(chunk, output_format):
+    """
+    Format a list of names as CSV rows or JSON Lines.
+
+    input:
+        chunk: list of strings
+        output_format: string, 'csv' or 'jsonl'
+    output:
+        string
+    """
+    if output_format == 'jsonl':
+        return ''.join(json.dumps({'name': name}) + '\n' for name in chunk)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([name] for name in chunk)
+    return buffer.getvalue()
+
+
+def _generate_chunk(entropy, index, size, gender, surname, weighted, output_format,
+                    filters):
+    """
+    Generate and format one chunk of names in a worker process.
+    """
+    chunk = names.random_names(size, gender, surname, weighted,
+                               rng=names.chunk_rng(entropy, index), **filters)
+    return format_names(chunk, output_format)
+
+
+def generate(n, out, gender="", surname=False, weighted=False, seed=None,
+             output_format='csv', workers=1, chunk_size=CHUNK_SIZE, **filters):
+    """
+    Write n random names to a text stream.
+
+    input:
+        n: int
+        out: writable text stream
+        gender, surname, weighted: see names.random_names()
+        seed: int; default None (fresh entropy)
+        output_format: string, 'csv' or 'jsonl'
+        workers: int, worker processes; 1 generates in this process
+        chunk_size: int, names per chunk
+        filters: start_year, end_year, top, and min_births; see names.random_names()
+    output:
+        int, the SeedSequence entropy of the run (pass it as seed to repeat the run)
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    out.write(header(output_format))
+
+    if workers <= 1:
+        for chunk in names.iter_random_names(n, gender, surname, weighted,
+                                             entropy, chunk_size, **filters):
+            out.write(format_names(chunk, output_format))
+        return entropy
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # keep a few chunks per worker in flight and write them in order,
+        # so finished chunks never pile up in memory
+        pending = deque()
+        for index, start in enumerate(range(0, n, chunk_size)):
+            size = min(chunk_size, n - start)
+            pending.append(executor.submit(_generate_chunk, entropy, index, size,
+                                           gender, surname, weighted, output_format,
+                                           filters))
+            if len(pending) >= workers * 2:
+                out.write(pending.popleft().result())
+        while pending:
+            out.write(pending.popleft().result())
+    return entropy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('count', type=int, help="number of names to generate")
+    parser.add_argument('--gender', choices=['m', 'f'], default='',
+                        help="only generate names given to boys (m) or girls (f)")
+    parser.add_argument('--surname', action='store_true', help="add a random surname")
+    parser.add_argument('--weighted', action='store_true',
+                        help="pick names in proportion to their number of births")
+    parser.add_argument('--start-year', type=int,
+                        help="earliest year to draw names from (default: first year with data)")
+    parser.add_argument('--end-year', type=int,
+                        help="latest year to draw names from (default: last year with data)")
+    parser.add_argument('--decade', type=int,
+                        help="only draw names from one decade, e.g. 1990")
+    parser.add_argument('--top', type=int,
+                        help="only draw from the N most popular names of each year")
+    parser.add_argument('--min-births', type=int,
+                        help="only draw names given at least this many times in their year")
+    parser.add_argument('--seed', type=int,
+                        help="seed for reproducible output (default: random, printed to stderr)")
+    parser.add_argument('--format', choices=FORMATS, default='csv', dest='output_format')
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f"names per chunk (default: {CHUNK_SIZE})")
+    args = parser.parse_args(argv)
+    if args.count < 0 or args.chunk_size < 1:
+        parser.error("count must be at least 0 and --chunk-size at least 1")
+    if args.decade is not None:
+        if args.start_year is not None or args.end_year is not None:
+            parser.error("--decade can't be combined with --start-year or --end-year")
+        args.start_year, args.end_year = args.decade // 10 * 10, args.decade // 10 * 10 + 9
+    if (args.top is not None and args.top < 1) or (args.min_births is not None
+                                                   and args.min_births < 1):
+        parser.error("--top and --min-births must be at least 1")
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        entropy = generate(args.count, out, args.gender, args.surname, args.weighted,
+                           args.seed, args.output_format, args.workers, args.chunk_size,
+                           start_year=args.start_year, end_year=args.end_year,
+                           top=args.top, min_births=args.min_births)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if args.output:
+            out.close()
+    print(f"Generated {args.count} names (seed {entropy}).", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
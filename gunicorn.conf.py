@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for serving the app: `gunicorn app:app`
+
+The app is imported once in the master process and pre-warmed before workers
+are forked, so new workers start with pandas, altair, the name index and the
+search index already in memory instead of loading them on their first request.
+
+Settings (environment variables):
+- PORT: port to listen on (default 8000)
+- WEB_CONCURRENCY: number of worker processes (default 2)
+- NAMES_PREWARM: set to 0 to skip pre-warming
+"""
+import os
+import time
+import startup
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Pre-warm the preloaded app in the master process before workers are forked.
+    """
+    if os.environ.get('NAMES_PREWARM', '1') == '0':
+        return
+    start = time.perf_counter()
+    for step, seconds in startup.prewarm().items():
+        server.log.info("prewarm %s: %.0f ms", step, seconds * 1000)
+    server.log.info("prewarm finished in %.0f ms", (time.perf_counter() - start) * 1000)
+
+
+def post_fork(server, worker):
+    """
+    Give each worker its own SQLite cache connection,
+    which must not be shared across processes.
+    """
+    import cache
+    if cache.response_cache.disk is not None:
+        cache.response_cache.disk = cache.SQLiteCache(cache.CACHE_DB)
@@ -0,0 +1,251 @@
+"""
+Shared HTTP client used for every outbound request.
+
+All requests go through one pooled requests.Session so connections are kept
+alive between calls. Responses with status 429 or a transient 5xx are retried
+with exponential backoff and jitter (honoring Retry-After up to
+MAX_RETRY_AFTER seconds; a response asking for a longer wait is returned
+without retrying, so a worker thread is never parked for minutes), and each host has
+a token-bucket rate limit so we stay under the free-tier API quotas.
+Every request is timed by host and status code in the metrics module.
+
+Settings (environment variables):
+- NAMES_HTTP_POOL_SIZE: connections kept open per host (default 20)
+- NAMES_HTTP_RETRIES: retries per request (default 3)
+- NAMES_HTTP_BACKOFF: backoff factor in seconds (default 0.5)
+- NAMES_HTTP_MAX_RETRY_AFTER: longest Retry-After wait honored, in seconds (default 3)
+- NAMES_RATE_LIMITS: per-host limits as "host=requests_per_second,..."
+"""
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+import metrics
+from startup import lazy_import
+
+# loaded on first request to keep app start-up fast
+requests = lazy_import('requests')
+
+POOL_SIZE = int(os.environ.get('NAMES_HTTP_POOL_SIZE', 20))
+RETRIES = int(os.environ.get('NAMES_HTTP_RETRIES', 3))
+BACKOFF_FACTOR = float(os.environ.get('NAMES_HTTP_BACKOFF', 0.5))
+BACKOFF_JITTER = 0.5
+MAX_RETRY_AFTER = float(os.environ.get('NAMES_HTTP_MAX_RETRY_AFTER', 3))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# requests per second allowed to each host; hosts not listed are not limited
+RATE_LIMITS = {
+    'api.nationalize.io': 5.0,
+    'api.genderize.io': 5.0,
+    'api.agify.io': 5.0,
+    'nameberry.com': 2.0,
+}
+
+
+def _parse_rate_limits(value):
+    """
+    Parse a "host=requests_per_second,..." string into a dictionary.
+    """
+    limits = {}
+    for item in value.split(','):
+        host, _, rate = item.partition('=')
+        if host.strip() and rate.strip():
+            limits[host.strip()] = float(rate)
+    return limits
+
+
+RATE_LIMITS.update(_parse_rate_limits(os.environ.get('NAMES_RATE_LIMITS', '')))
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` requests per second
+    with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Take a token if one is available.
+
+        output:
+            0 if a request may be sent now, otherwise seconds until the next token
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Block until a request may be sent.
+
+        output:
+            seconds spent waiting
+        """
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return time.monotonic() - start
+            time.sleep(wait)
+
+
+_session = None
+_session_lock = threading.Lock()
+_limiters = {}
+_retry_class = None
+
+
+def retry_class():
+    """
+    Return a urllib3 Retry subclass that caps Retry-After waits at MAX_RETRY_AFTER.
+
+    urllib3 sleeps for the full Retry-After value, ignoring the request
+    timeout. Responses asking for a longer wait than MAX_RETRY_AFTER are
+    returned at once instead of retried (the caller sees the 429 or 503).
+    Created on first use because requests is imported lazily.
+    """
+    global _retry_class
+    if _retry_class is None:
+        from urllib3.exceptions import InvalidHeader
+        base = requests.adapters.Retry
+
+        class CappedRetry(base):
+            def get_retry_after(self, response):
+                retry_after = super().get_retry_after(response)
+                return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER)
+
+            def increment(self, method=None, url=None, response=None, error=None,
+                          _pool=None, _stacktrace=None):
+                if response is not None:
+                    try:
+                        retry_after = base.get_retry_after(self, response)
+                    except InvalidHeader:
+                        # left for urllib3 to handle as it would without the cap
+                        retry_after = None
+                    if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                        # give up now; with raise_on_status=False urllib3
+                        # returns this response to the caller
+                        raise requests.adapters.MaxRetryError(
+                            _pool, url, f"Retry-After of {retry_after:.0f}s is too long")
+                return super().increment(method, url, response, error, _pool, _stacktrace)
+
+        _retry_class = CappedRetry
+    return _retry_class
+
+
+def create_session(pool_size=POOL_SIZE, retries=RETRIES,
+                   backoff_factor=BACKOFF_FACTOR):
+    """
+    Create a session with connection pooling and retries.
+
+    input:
+        pool_size: int, connections kept open per host
+        retries: int, retries for failed connections and retryable statuses
+        backoff_factor: float, base of the exponential backoff in seconds
+    output:
+        requests.Session
+    """
+    retry = retry_class()(
+        total=retries,
+        backoff_factor=backoff_factor,
+        backoff_jitter=BACKOFF_JITTER,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        # return the last response so callers' raise_for_status() reports it
+        raise_on_status=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the shared session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def limiter_for(url):
+    """
+    Return the rate limiter for a URL's host, or None if the host is not limited.
+    """
+    host = urlsplit(url).hostname or ''
+    if host not in RATE_LIMITS:
+        return None
+    with _session_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter(RATE_LIMITS[host])
+        return _limiters[host]
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the shared session, waiting for the host's rate limit.
+
+    input:
+        method: string, HTTP method
+        url: string
+        kwargs: passed on to requests.Session.request()
+    output:
+        requests.Response
+    """
+    host = urlsplit(url).hostname or ''
+    limiter = limiter_for(url)
+    if limiter is not None:
+        metrics.RATE_LIMIT_WAIT.observe(limiter.acquire(), host=host)
+
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        response = get_session().request(method, url, **kwargs)
+        status = response.status_code
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+        if retries:
+            metrics.UPSTREAM_RETRIES.inc(len(retries), host=host)
+        return response
+    except requests.exceptions.Timeout:
+        status = 'timeout'
+        raise
+    except requests.exceptions.ConnectionError:
+        status = 'connection_error'
+        raise
+    finally:
+        metrics.UPSTREAM_DURATION.observe(time.perf_counter() - start,
+                                          host=host, status=status)
+
+
+def get(url, **kwargs):
+    """
+    Send a GET request through the shared session.
+    """
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """
+    Send a POST request through the shared session.
+    """
+    return request('POST', url, **kwargs)
@@ -0,0 +1,230 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are kept in memory per process and rendered by
+render(), which the app serves on /metrics and gather_data.py can write to a
+file for node_exporter's textfile collector.
+
+Recorded metrics:
+- names_request_duration_seconds{route, method, status}: Flask route latency
+- names_upstream_duration_seconds{host, status}: outbound HTTP calls; status is
+  the HTTP status code, 'timeout', 'connection_error' or 'error'
+- names_upstream_retries_total{host}: retries made by the HTTP client
+- names_rate_limit_wait_seconds{host}: time spent waiting for a host's rate limit
+- names_lookup_duration_seconds{source, cache, result}: name lookups
+  (nationalize, genderize, agify, nameberry, spotify) including cache hits
+- names_download_duration_seconds{source, result} and
+  names_download_bytes_total{host}: dataset downloads
+- names_missing_year_files_total: popularity queries for years without data
+- names_cache_requests_total{source, result}: response cache hits and misses
+- names_cache_hit_ratio{source}: share of response cache lookups answered from cache
+"""
+import time
+import bisect
+import threading
+import contextlib
+
+# upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    """
+    Format label names and values as {name="value",...}.
+    """
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"'
+                          for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Thread-safe counter with optional labels.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        """
+        Add amount to the counter for the given label values.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Return the current count for the given label values.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, key), value)
+                for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Thread-safe histogram with cumulative buckets and optional labels.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        """
+        Record one observation for the given label values.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Context manager observing the time spent in its block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        rows = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                rows.append((f'{self.name}_bucket',
+                             _format_labels(self.labelnames, key,
+                                            [('le', _format_value(float(bound)))]),
+                             cumulative))
+            rows.append((f'{self.name}_sum', _format_labels(self.labelnames, key), total))
+            rows.append((f'{self.name}_count', _format_labels(self.labelnames, key),
+                         cumulative))
+        return rows
+
+
+def register_collector(collect):
+    """
+    Register a function called on every render() that returns extra metrics
+    as a list of (name, type, description, [(labels dict, value), ...]) tuples.
+    """
+    _collectors.append(collect)
+
+
+def render():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    output:
+        string
+    """
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(f'{name}{labels} {_format_value(value)}'
+                     for name, labels, value in metric.samples())
+    for collect in _collectors:
+        for name, kind, description, samples in collect():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{_format_labels(labels.keys(), labels.values())} '
+                         f'{_format_value(value)}'
+                         for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write(path):
+    """
+    Write the rendered metrics to a file, e.g. for node_exporter's textfile collector.
+    """
+    with open(path, 'w') as f:
+        f.write(render())
+
+
+REQUEST_DURATION = Histogram(
+    'names_request_duration_seconds', 'Time spent handling Flask requests.',
+    ['route', 'method', 'status'])
+UPSTREAM_DURATION = Histogram(
+    'names_upstream_duration_seconds',
+    'Time spent on outbound HTTP requests, including retries.',
+    ['host', 'status'])
+UPSTREAM_RETRIES = Counter(
+    'names_upstream_retries_total', 'Retries made by the HTTP client.', ['host'])
+RATE_LIMIT_WAIT = Histogram(
+    'names_rate_limit_wait_seconds', "Time spent waiting for a host's rate limit.",
+    ['host'])
+LOOKUP_DURATION = Histogram(
+    'names_lookup_duration_seconds',
+    'Time spent on name lookups; cache is hit or miss, result is ok, no_data or error.',
+    ['source', 'cache', 'result'])
+DOWNLOAD_DURATION = Histogram(
+    'names_download_duration_seconds', 'Time spent downloading datasets.',
+    ['source', 'result'], buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+DOWNLOAD_BYTES = Counter(
+    'names_download_bytes_total', 'Bytes downloaded for datasets.', ['host'])
+MISSING_YEAR_FILES = Counter(
+    'names_missing_year_files_total', 'Popularity queries for years without a data file.')
+
+
+def _cache_metrics():
+    """
+    Report the response cache counters and hit ratio per source.
+    """
+    import cache
+    stats = cache.stats()
+    requests, ratios = [], []
+    for source, counts in sorted(stats.items()):
+        for result in ('memory_hits', 'disk_hits', 'misses'):
+            requests.append(({'source': source, 'result': result}, counts.get(result, 0)))
+        lookups = sum(counts.values())
+        if lookups:
+            hits = counts.get('memory_hits', 0) + counts.get('disk_hits', 0)
+            ratios.append(({'source': source}, hits / lookups))
+    return [
+        ('names_cache_requests_total', 'counter',
+         'Response cache lookups by source and result.', requests),
+        ('names_cache_hit_ratio', 'gauge',
+         'Share of response cache lookups answered from the cache.', ratios),
+    ]
+
+
+register_collector(_cache_metrics)
@@ -0,0 +1,388 @@
+"""
+Compile the SSA annual name files into a compact on-disk index.
+
+The index lives in names_files/index/ and contains
+- keys.txt: one interned "Name,Sex" key per line (the line number is the name ID),
+- births.npy: a (name ID x year) matrix of births, opened with mmap,
+- meta.json: the year range covered by the matrix and a checksum of each year file,
+
+and tables derived from the births matrix during ingestion:
+- totals.npy: total births per (sex, year), used for shares of births,
+- ranks.npy: a (name ID x year) matrix of yearly ranks within each sex (0 if not given),
+- aggregates.npy: total births, peak year, and first and last year seen per name ID, and
+- by_rank.npy / by_rank_offsets.npy: the name IDs of each (year, sex) sorted by births.
+
+A popularity query for one name is then a single row slice of the
+births matrix instead of a scan through every yobYYYY.txt file.
+"""
+import os
+import re
+import json
+import hashlib
+import numpy as np
+
+DATA_DIR = os.environ.get(
+    'NAMES_DATA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'names_files'))
+INDEX_DIR = os.path.join(DATA_DIR, 'index')
+
+YEAR_FILE_PATTERN = re.compile(r'^yob(\d{4})\.txt$')
+
+
+def year_files(data_dir=DATA_DIR):
+    """
+    Find the SSA annual name files in a directory.
+
+    input:
+        data_dir: string
+    output:
+        dictionary mapping year (int) to file path, sorted by year
+    """
+    files = {}
+    if not os.path.isdir(data_dir):
+        return files
+    for file_name in os.listdir(data_dir):
+        match = YEAR_FILE_PATTERN.match(file_name)
+        if match:
+            files[int(match.group(1))] = os.path.join(data_dir, file_name)
+    return dict(sorted(files.items()))
+
+
+def read_year_file(file_path):
+    """
+    Parse one SSA annual name file.
+
+    input:
+        file_path: string
+    output:
+        list of (name, sex, births) tuples in file order
+    """
+    records = []
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            n, g, births = line.split(',')
+            records.append((n, g.upper(), int(births)))
+    return records
+
+
+SEXES = ('F', 'M')
+
+AGGREGATE_DTYPE = np.dtype([
+    ('total', np.int64),
+    ('peak_year', np.int16),
+    ('first_year', np.int16),
+    ('last_year', np.int16),
+])
+
+
+def _write_atomic(path, write):
+    """
+    Write a file through a temporary path so readers never see a partial file.
+    """
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_array(path, array):
+    """
+    Save a NumPy array atomically in .npy format.
+    """
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+    _write_atomic(path, write)
+
+
+def derive_tables(births, sexes, first_year):
+    """
+    Compute the per-name aggregates and per-year rank tables from the births matrix.
+
+    input:
+        births: (name ID x year) array of births
+        sexes: array of 'F'/'M' per name ID
+        first_year: int, year of the first column
+    output:
+        dictionary mapping table name to array
+    """
+    num_keys, num_years = births.shape
+    sex_ids = (sexes == 'M').astype(np.int64)
+
+    totals = np.zeros((len(SEXES), num_years), dtype=np.int64)
+    ranks = np.zeros((num_keys, num_years), dtype=np.int32)
+    segments = []
+    offsets = [0]
+
+    for col in range(num_years):
+        column = np.asarray(births[:, col])
+        for sex_id in range(len(SEXES)):
+            ids = np.flatnonzero((column > 0) & (sex_ids == sex_id))
+            # stable sort keeps tied names in alphabetical (name ID) order
+            ordered = ids[np.argsort(-column[ids], kind='stable')]
+            values = column[ordered]
+            # tied names share a rank: 1 + number of names with more births
+            ranks[ordered, col] = np.searchsorted(-values, -values, side='left') + 1
+            totals[sex_id, col] = values.sum()
+            segments.append(ordered)
+            offsets.append(offsets[-1] + ordered.size)
+
+    given = births > 0
+    aggregates = np.zeros(num_keys, dtype=AGGREGATE_DTYPE)
+    aggregates['total'] = births.sum(axis=1, dtype=np.int64)
+    aggregates['peak_year'] = first_year + births.argmax(axis=1)
+    aggregates['first_year'] = first_year + given.argmax(axis=1)
+    aggregates['last_year'] = first_year + num_years - 1 - given[:, ::-1].argmax(axis=1)
+
+    return {
+        'totals': totals,
+        'ranks': ranks,
+        'aggregates': aggregates,
+        'by_rank': np.concatenate(segments).astype(np.int32) if segments
+        else np.empty(0, dtype=np.int32),
+        'by_rank_offsets': np.array(offsets, dtype=np.int64),
+    }
+
+
+def file_checksum(file_path):
+    """
+    Return the SHA-256 hex digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_index(data_dir=DATA_DIR, index_dir=None):
+    """
+    Compile every yobYYYY.txt file in data_dir into the on-disk index.
+
+    input:
+        data_dir: string
+        index_dir: string; default data_dir/index
+    output:
+        dictionary of index metadata
+    """
+    return _compile_index(data_dir, index_dir, incremental=False)
+
+
+def update_index(data_dir=DATA_DIR, index_dir=None):
+    """
+    Bring the on-disk index up to date by re-reading only the year files
+    whose checksum changed since the index was built. When no new names
+    or years appear, the changed columns are rewritten in place.
+
+    input:
+        data_dir: string
+        index_dir: string; default data_dir/index
+    output:
+        dictionary of index metadata
+    """
+    return _compile_index(data_dir, index_dir, incremental=True)
+
+
+def _compile_index(data_dir, index_dir, incremental):
+    """
+    Shared implementation of build_index() and update_index().
+    """
+    index_dir = index_dir or os.path.join(data_dir, 'index')
+    files = year_files(data_dir)
+    if not files:
+        raise FileNotFoundError(
+            f"No yobYYYY.txt files found in {data_dir}. Run gather_data.py first.")
+
+    checksums = {str(year): file_checksum(path) for year, path in files.items()}
+    first_year, last_year = min(files), max(files)
+
+    old = None
+    if incremental and os.path.exists(os.path.join(index_dir, 'meta.json')):
+        old = NameIndex(index_dir)
+        old_checksums = old.meta.get('year_checksums', {})
+        # a year file that disappeared can't be patched; rebuild from scratch
+        if set(old_checksums) - set(checksums):
+            old = None
+    if old is None:
+        old_checksums = {}
+
+    changed = [year for year in files if old_checksums.get(str(year)) != checksums[str(year)]]
+    if old is not None and not changed:
+        return old.meta
+
+    parsed = {year: read_year_file(files[year]) for year in changed}
+    old_keys = old.keys if old is not None else []
+    new_keys = {(n, g) for records in parsed.values() for n, g, _ in records}
+    new_keys.difference_update(old_keys)
+
+    births_path = os.path.join(index_dir, 'births.npy')
+    in_place = (old is not None and not new_keys
+                and (first_year, last_year) == (old.first_year, old.last_year))
+
+    if in_place:
+        keys = old_keys
+        key_ids = old.key_ids
+        births = np.load(births_path, mmap_mode='r+')
+    else:
+        # sort keys so the name IDs are stable between builds
+        keys = sorted(set(old_keys) | new_keys, key=lambda k: (k[0].lower(), k[1]))
+        key_ids = {(n.lower(), g): i for i, (n, g) in enumerate(keys)}
+        births = np.zeros((len(keys), last_year - first_year + 1), dtype=np.int32)
+        if old is not None and old_keys:
+            # carry over the unchanged years from the old matrix
+            old_rows = np.array([key_ids[(n.lower(), g)] for n, g in old_keys])
+            births[old_rows, old.first_year - first_year:
+                   old.last_year - first_year + 1] = old.births
+
+    for year, records in parsed.items():
+        col = year - first_year
+        births[:, col] = 0
+        rows = [key_ids[(n.lower(), g)] for n, g, _ in records]
+        births[rows, col] = [b for _, _, b in records]
+
+    meta = {
+        'first_year': first_year,
+        'last_year': last_year,
+        'num_keys': len(keys),
+        'year_checksums': checksums,
+        # identifies this version of the data for caches built on top of it
+        'version': hashlib.sha256(
+            json.dumps(checksums, sort_keys=True).encode()).hexdigest()[:16],
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+
+    def write_keys(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{n},{g}\n" for n, g in keys)
+
+    def write_meta(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    if in_place:
+        births.flush()
+    else:
+        _write_atomic(os.path.join(index_dir, 'keys.txt'), write_keys)
+        _save_array(births_path, births)
+
+    # derived tables only need the births matrix, so they are recomputed
+    # from it rather than from the raw files
+    sexes = np.array([g for _, g in keys])
+    for table, array in derive_tables(births, sexes, first_year).items():
+        _save_array(os.path.join(index_dir, f'{table}.npy'), array)
+    _write_atomic(os.path.join(index_dir, 'meta.json'), write_meta)
+    return meta
+
+
+class NameIndex:
+    """
+    Read-only view of the compiled name index.
+    """
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.first_year = self.meta['first_year']
+        self.last_year = self.meta['last_year']
+
+        with open(os.path.join(index_dir, 'keys.txt'), encoding='utf-8') as f:
+            self.keys = [tuple(line.rstrip('\n').split(',')) for line in f]
+        self.key_ids = {(n.lower(), g): i for i, (n, g) in enumerate(self.keys)}
+        self.names = np.array([n for n, _ in self.keys], dtype=object)
+        self.sexes = np.array([g for _, g in self.keys])
+
+        self.births = np.load(os.path.join(index_dir, 'births.npy'), mmap_mode='r')
+        self.totals = np.load(os.path.join(index_dir, 'totals.npy'))
+        self.ranks = np.load(os.path.join(index_dir, 'ranks.npy'), mmap_mode='r')
+        self.aggregates = np.load(os.path.join(index_dir, 'aggregates.npy'), mmap_mode='r')
+        self.by_rank = np.load(os.path.join(index_dir, 'by_rank.npy'), mmap_mode='r')
+        self.by_rank_offsets = np.load(os.path.join(index_dir, 'by_rank_offsets.npy'))
+
+    def key_id(self, name, gender):
+        """
+        Return the interned ID for a (name, gender) pair or None if unknown.
+        """
+        return self.key_ids.get((name.lower(), gender.upper()))
+
+    def year_column(self, year, gender=''):
+        """
+        Return the IDs and births of every name given in a year,
+        optionally limited to one gender.
+        """
+        if not self.first_year <= year <= self.last_year:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        column = np.asarray(self.births[:, year - self.first_year])
+        mask = column > 0
+        if gender:
+            mask &= self.sexes == gender.upper()
+        ids = np.flatnonzero(mask)
+        return ids, column[ids].astype(np.int64)
+
+    def ranked_ids(self, year, gender):
+        """
+        Return the IDs of every name of one gender given in a year,
+        sorted from most to fewest births.
+        """
+        if not self.first_year <= year <= self.last_year:
+            return np.empty(0, dtype=np.int32)
+        segment = (year - self.first_year) * len(SEXES) + SEXES.index(gender.upper())
+        start, end = self.by_rank_offsets[segment:segment + 2]
+        return self.by_rank[start:end]
+
+    def births_range(self, name, gender, start_year, end_year):
+        """
+        Return births for each year in [start_year, end_year] as an array;
+        years outside the indexed range or unknown names count as 0.
+        """
+        return self.births_matrix([(name, gender)], start_year, end_year)[0]
+
+    def births_matrix(self, pairs, start_year, end_year):
+        """
+        Return births for several (name, gender) pairs at once as a
+        (pair x year) array covering [start_year, end_year].
+        """
+        out = np.zeros((len(pairs), max(end_year - start_year + 1, 0)),
+                       dtype=np.int64)
+        ids = np.array([-1 if (i := self.key_id(n, g)) is None else i
+                        for n, g in pairs], dtype=np.int64)
+        found = np.flatnonzero(ids >= 0)
+        lo = max(start_year, self.first_year)
+        hi = min(end_year, self.last_year)
+        if found.size and lo <= hi:
+            out[found, lo - start_year:hi - start_year + 1] = \
+                self.births[ids[found], lo - self.first_year:hi - self.first_year + 1]
+        return out
+
+
+_loaded = {}
+
+
+def load_index(index_dir=INDEX_DIR):
+    """
+    Open the compiled index, once per process; the index is
+    reopened automatically after it has been rebuilt or updated.
+
+    output:
+        NameIndex or None if the index has not been built
+    """
+    try:
+        stamp = os.stat(os.path.join(index_dir, 'meta.json')).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    loaded = _loaded.get(index_dir)
+    if loaded is None or loaded[0] != stamp:
+        loaded = (stamp, NameIndex(index_dir))
+        _loaded[index_dir] = loaded
+    return loaded[1]
+
+
+def dataset_version(index_dir=INDEX_DIR):
+    """
+    Return an identifier that changes whenever the indexed data changes,
+    or "" if the index has not been built.
+    """
+    index = load_index(index_dir)
+    return index.meta.get('version', '') if index is not None else ''
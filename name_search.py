@@ -0,0 +1,206 @@
+"""
+In-memory search over every distinct name in the SSA files,
+used to autocomplete names as the user types.
+
+- Prefix search uses a sorted array of lower-cased names and binary search.
+- Typo-tolerant search uses a deletion index: every name is stored under
+  itself and each string made by deleting one of its letters, so names one
+  edit away from a query (insertion, deletion, substitution, or swap of
+  adjacent letters) share at least one key with the query.
+
+Matches are ordered by total births so the most common names come first.
+"""
+import threading
+from bisect import bisect_left
+import numpy as np
+import name_index
+
+
+def _deletions(word):
+    """
+    Return the word and every string made by deleting one of its letters.
+    """
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _within_one_edit(a, b):
+    """
+    Check if two strings differ by at most one insertion, deletion,
+    substitution, or swap of adjacent letters.
+    """
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    # skip the common prefix, then compare what is left
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return (a[i + 1:] == b[i + 1:] or
+                (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]))
+    return a[i:] == b[i + 1:]
+
+
+class NameSearch:
+    """
+    Prefix and typo-tolerant search over a fixed list of names.
+    """
+
+    def __init__(self, names, popularity):
+        """
+        input:
+            names: list of distinct names (any case)
+            popularity: list of total births per name, used to order matches
+        """
+        order = sorted(range(len(names)), key=lambda i: names[i].lower())
+        self.names = np.array([names[i] for i in order], dtype=object)
+        self.lowered = [names[i].lower() for i in order]
+        self.popularity = np.asarray(popularity, dtype=np.int64)[order]
+        self._deletion_hashes = None
+        self._deletion_ids = None
+        self._lock = threading.Lock()
+
+    def _most_popular(self, ids, limit):
+        """
+        Return the names for up to limit of the given IDs, most popular first.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.size > limit:
+            ids = ids[np.argpartition(-self.popularity[ids], limit - 1)[:limit]]
+        ids = ids[np.argsort(-self.popularity[ids], kind='stable')]
+        return self.names[ids].tolist()
+
+    def prefix(self, query, limit=10):
+        """
+        Return up to limit names starting with query.
+
+        input:
+            query: string
+            limit: int; default 10
+        output:
+            list of names, most popular first
+        """
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+        start = bisect_left(self.lowered, query)
+        end = bisect_left(self.lowered, query + '\uffff', lo=start)
+        return self._most_popular(np.arange(start, end), limit)
+
+    def _build_deletion_index(self):
+        """
+        Build the deletion index used by fuzzy(), once.
+        """
+        with self._lock:
+            if self._deletion_hashes is not None:
+                return
+            hashes, ids = [], []
+            for name_id, name in enumerate(self.lowered):
+                for variant in _deletions(name):
+                    hashes.append(hash(variant))
+                    ids.append(name_id)
+            hashes = np.array(hashes, dtype=np.int64)
+            order = np.argsort(hashes, kind='stable')
+            self._deletion_ids = np.array(ids, dtype=np.int32)[order]
+            self._deletion_hashes = hashes[order]
+
+    def fuzzy(self, query, limit=10):
+        """
+        Return up to limit names within one typo of query.
+
+        input:
+            query: string
+            limit: int; default 10
+        output:
+            list of names, most popular first
+        """
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+        if self._deletion_hashes is None:
+            self._build_deletion_index()
+
+        keys = np.array([hash(variant) for variant in _deletions(query)], dtype=np.int64)
+        starts = np.searchsorted(self._deletion_hashes, keys, side='left')
+        ends = np.searchsorted(self._deletion_hashes, keys, side='right')
+        candidates = {int(name_id) for start, end in zip(starts, ends)
+                      for name_id in self._deletion_ids[start:end]}
+        # hash collisions and two-edit pairs can share a key; check each candidate
+        matches = [name_id for name_id in candidates
+                   if _within_one_edit(query, self.lowered[name_id])]
+        return self._most_popular(matches, limit)
+
+    def complete(self, query, limit=10):
+        """
+        Return prefix matches for query, topped up with typo-tolerant matches.
+
+        output:
+            list of up to limit names
+        """
+        matches = self.prefix(query, limit)
+        if len(matches) < limit:
+            seen = set(matches)
+            matches += [name for name in self.fuzzy(query, limit)
+                        if name not in seen][:limit - len(matches)]
+        return matches
+
+
+def _distinct_names():
+    """
+    Collect every distinct name and its total births across both sexes.
+
+    output:
+        tuple of (list of names, list of total births)
+    """
+    totals = {}
+    display = {}
+    index = name_index.load_index()
+    if index is not None:
+        records = zip(index.names, index.aggregates['total'])
+    else:
+        records = ((n, births) for file_path in name_index.year_files().values()
+                   for n, _, births in name_index.read_year_file(file_path))
+    for name, births in records:
+        key = name.lower()
+        display.setdefault(key, name)
+        totals[key] = totals.get(key, 0) + int(births)
+    return [display[key] for key in totals], list(totals.values())
+
+
+_search = {}
+_search_lock = threading.Lock()
+
+
+def get_search():
+    """
+    Return the search index for the current dataset, building it on first use.
+    The typo-tolerant deletion index is built along with it, so the first
+    fuzzy query is as fast as later ones (and prewarm() covers it).
+    """
+    version = name_index.dataset_version()
+    search = _search.get(version)
+    if search is None:
+        with _search_lock:
+            search = _search.get(version)
+            if search is None:
+                _search.clear()
+                search = NameSearch(*_distinct_names())
+                search._build_deletion_index()
+                _search[version] = search
+    return search
+
+
+def autocomplete(query, limit=10):
+    """
+    Suggest names for a partially typed name.
+
+    input:
+        query: string
+        limit: int; default 10
+    output:
+        list of up to limit names, prefix matches first
+    """
+    return get_search().complete(query, limit)
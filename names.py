@@ -6,13 +6,30 @@ retrieve information about name meanings and
 predicted gender, age, and nationality.
 """
 import os
+import time
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait
 from csv import reader
-import random
-import requests
-from requests.auth import HTTPBasicAuth
-from bs4 import BeautifulSoup
-import pycountry
-import pandas as pd
+import numpy as np
+import http_client
+import metrics
+import name_index
+from startup import lazy_import
+from cache import cached, cache_key, ttl_for, response_cache
+
+# heavy dependencies load on first use to keep app start-up fast
+requests = lazy_import('requests')
+bs4 = lazy_import('bs4')
+pycountry = lazy_import('pycountry')
+pd = lazy_import('pandas')
+
+# overall deadline (seconds) and worker count for name_information() lookups
+LOOKUP_DEADLINE = float(os.environ.get('NAMES_LOOKUP_DEADLINE', 12))
+LOOKUP_WORKERS = int(os.environ.get('NAMES_LOOKUP_WORKERS', 16))
+
+_lookup_pool = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS,
+                                  thread_name_prefix='name-lookup')
 
 
 def load_yearly_data(year, name, gender):
@@ -28,8 +45,7 @@ def load_yearly_data(year, name, gender):
         number of births associated with given name and gender for that year;
             0 if name isn't found
     """
-    file_name = f'names_files/yob{year}.txt'
-    file_path = os.path.join(os.path.dirname(__file__), file_name)
+    file_path = os.path.join(name_index.DATA_DIR, f'yob{year}.txt')
     try:
         with open(file_path, 'r', encoding='utf-8-sig') as f:
             for line in f:
@@ -37,6 +53,7 @@ def load_yearly_data(year, name, gender):
                 if n.lower() == name.lower() and g.lower() == gender.lower():
                     return int(births)
     except FileNotFoundError:
+        metrics.MISSING_YEAR_FILES.inc()
         print(f"Data for the year {year} is not available.")
     return 0
 
@@ -55,6 +72,13 @@ def popularity(name, gender, start_year, end_year):
     ouput:
         Pandas DataFrame
     """
+    # answer from the compiled index when gather_data.py has built it
+    index = name_index.load_index()
+    if index is not None:
+        births = index.births_range(name, gender, start_year, end_year)
+        return pd.DataFrame({'Year': range(start_year, end_year + 1),
+                             'Births': births})
+
     data = {'Year': [], 'Births': []}
 
     for year in range(start_year, end_year + 1):
@@ -64,59 +88,446 @@ def popularity(name, gender, start_year, end_year):
     return pd.DataFrame(data)
 
 
-def random_surname():
+def popularity_many(pairs, start_year, end_year):
+    """
+    Return the number of occurrences of several names
+    for each year within a given range.
+
+    input:
+        pairs: list of (name, gender) tuples; gender is 'm' or 'f'
+        start_year: int
+        end_year: int
+
+    ouput:
+        Pandas DataFrame with a 'Year' column and one column of births
+        per pair, labelled "Name (M)" or "Name (F)"
+    """
+    # drop duplicate pairs while keeping the order they were given in
+    pairs = list(dict.fromkeys((n.strip().capitalize(), g.upper())
+                               for n, g in pairs))
+    labels = [f"{n} ({g})" for n, g in pairs]
+    years = range(start_year, end_year + 1)
+
+    index = name_index.load_index()
+    if index is not None:
+        births = index.births_matrix(pairs, start_year, end_year)
+    else:
+        births = _births_matrix_from_files(pairs, years)
+
+    df = pd.DataFrame(births.T, columns=labels)
+    df.insert(0, 'Year', years)
+    return df
+
+
+def _require_index():
+    """
+    Return the compiled name index, which the aggregate and rank
+    queries are answered from.
+    """
+    index = name_index.load_index()
+    if index is None:
+        raise FileNotFoundError(
+            "The name index has not been built. Run gather_data.py first.")
+    return index
+
+
+def name_summary(name, gender):
+    """
+    Return precomputed totals for a name across all years.
+
+    input:
+        name: string
+        gender: string - 'm' for male or 'f' for female
+
+    output:
+        dictionary with total births, peak year and births,
+        and first and last year the name was given; None if the name is unknown
+    """
+    index = _require_index()
+    key_id = index.key_id(name, gender)
+    if key_id is None:
+        return None
+    aggregates = index.aggregates[key_id]
+    peak_year = int(aggregates['peak_year'])
+    return {
+        'name': index.keys[key_id][0],
+        'gender': index.keys[key_id][1],
+        'total_births': int(aggregates['total']),
+        'peak_year': peak_year,
+        'peak_births': int(index.births[key_id, peak_year - index.first_year]),
+        'first_year': int(aggregates['first_year']),
+        'last_year': int(aggregates['last_year']),
+    }
+
+
+def top_names(year, gender, n=100):
+    """
+    Return the most popular names of one gender in a year.
+
+    input:
+        year: int
+        gender: string - 'm' for male or 'f' for female
+        n: int; default 100
+
+    ouput:
+        Pandas DataFrame with 'Rank', 'Name', 'Births', and 'Share' columns
+        (share of all births of that gender in that year)
+    """
+    index = _require_index()
+    ids = np.asarray(index.ranked_ids(year, gender)[:n], dtype=np.int64)
+    col = min(max(year - index.first_year, 0), index.last_year - index.first_year)
+    births = np.asarray(index.births[ids, col])
+    total = index.totals[name_index.SEXES.index(gender.upper()), col]
+    return pd.DataFrame({
+        'Rank': np.asarray(index.ranks[ids, col]),
+        'Name': index.names[ids],
+        'Births': births,
+        'Share': births / max(total, 1),
+    })
+
+
+def rank_history(name, gender, start_year, end_year):
+    """
+    Return the yearly rank and share of births of a name within a given range.
+
+    input:
+        name: string
+        gender: string - 'm' for male or 'f' for female
+        start_year: int
+        end_year: int
+
+    ouput:
+        Pandas DataFrame with 'Year', 'Rank', 'Births', and 'Share' columns;
+        only years in which the name was given are included
+    """
+    index = _require_index()
+    key_id = index.key_id(name, gender)
+    lo = max(start_year, index.first_year)
+    hi = min(end_year, index.last_year)
+    if key_id is None or lo > hi:
+        return pd.DataFrame({'Year': [], 'Rank': [], 'Births': [], 'Share': []})
+
+    cols = slice(lo - index.first_year, hi - index.first_year + 1)
+    ranks = np.asarray(index.ranks[key_id, cols])
+    births = np.asarray(index.births[key_id, cols])
+    totals = index.totals[name_index.SEXES.index(gender.upper()), cols]
+    given = ranks > 0
+    return pd.DataFrame({
+        'Year': np.arange(lo, hi + 1)[given],
+        'Rank': ranks[given],
+        'Births': births[given],
+        'Share': births[given] / totals[given],
+    })
+
+
+def _births_matrix_from_files(pairs, years):
+    """
+    Build a (pair x year) births array by reading each year file once;
+    used when the compiled index is not available.
+    """
+    keys = pd.DataFrame({'Name': [n.lower() for n, _ in pairs],
+                         'Sex': [g for _, g in pairs],
+                         'Pair': range(len(pairs))})
+    births = np.zeros((len(pairs), len(years)), dtype=np.int64)
+    files = name_index.year_files()
+
+    for col, year in enumerate(years):
+        if year not in files:
+            metrics.MISSING_YEAR_FILES.inc()
+            print(f"Data for the year {year} is not available.")
+            continue
+        year_df = pd.read_csv(files[year], names=['Name', 'Sex', 'Births'],
+                              encoding='utf-8-sig')
+        year_df['Name'] = year_df['Name'].str.lower()
+        matched = keys.merge(year_df, on=['Name', 'Sex'])
+        births[matched['Pair'].to_numpy(), col] = matched['Births'].to_numpy()
+    return births
+
+
+@functools.lru_cache(maxsize=1)
+def _surname_pool():
+    """
+    Load the Census surnames file once, without its header and footer rows.
+
+    output:
+        tuple of (read-only array of surnames, read-only cumulative counts array)
+    """
+    file_path = os.path.join(name_index.DATA_DIR, 'surnames.csv')
+    with open(file_path, encoding='utf-8-sig') as f:
+        # skip first 3 rows and ignore last 3 rows of file
+        rows = list(reader(f))[3:-3]
+
+    surnames = np.array([row[0].lower().capitalize() for row in rows],
+                        dtype=object)
+    counts = np.array([_surname_count(row) for row in rows], dtype=np.int64)
+    cumulative = np.cumsum(counts)
+
+    surnames.flags.writeable = False
+    cumulative.flags.writeable = False
+    return surnames, cumulative
+
+
+def _surname_count(row):
+    """
+    Read the Census count column of a surnames row; rows without
+    a usable count get a weight of 1.
+    """
+    try:
+        return max(int(float(row[2].replace(',', ''))), 1)
+    except (IndexError, ValueError):
+        return 1
+
+
+def random_surnames(n, weighted=False, rng=None, seed=None):
+    """
+    Select n random surnames from the surnames file in one pass.
+
+    input:
+        n: int
+        weighted: boolean; default False (every surname is equally likely)
+        rng: numpy Generator; default new Generator seeded with seed
+        seed: int, makes the selection reproducible; default None (random)
+    output:
+        list of strings (surnames)
+    """
+    rng = rng or np.random.default_rng(seed)
+    surnames, cumulative = _surname_pool()
+    if weighted:
+        picks = np.searchsorted(cumulative, rng.integers(cumulative[-1], size=n),
+                                side='right')
+    else:
+        picks = rng.integers(surnames.size, size=n)
+    return surnames[picks].tolist()
+
+
+def random_surname(seed=None):
     """
     Select random surname from the surnames file.
 
+    input:
+        seed: int, makes the selection reproducible; default None (random)
     output:
         string (surname)
     """
-    with open("names_files/surnames.csv", encoding='utf-8-sig') as f:
-        csv_reader = reader(f)
-        # skip first 3 rows in file
-        for _ in range(3):
-            next(csv_reader)
+    return random_surnames(1, seed=seed)[0]
 
-        total_surnames = list(csv_reader)
 
-        # ignore last 3 rows of file
-        random_line = random.choice(total_surnames[:-3])
-        surname = random_line[0].lower()
-        return surname.capitalize()
+@functools.lru_cache(maxsize=8)
+def _available_years(version=''):
+    """
+    Find the years with name data, once per dataset version.
+    """
+    index = name_index.load_index()
+    if index is not None:
+        given = np.flatnonzero(index.totals.sum(axis=0) > 0)
+        return tuple(int(col) + index.first_year for col in given)
+    return tuple(name_index.year_files())
 
 
-def random_name(gender="", surname=False):
+def available_years():
     """
-    Generate random name with options to 
-    specify gender and generate random surname.
+    Return the years with name data on disk, read from the compiled index
+    when it has been built and from the yobYYYY.txt files otherwise.
+
+    output:
+        tuple of ints, sorted
+    """
+    return _available_years(name_index.dataset_version())
+
+
+@functools.lru_cache(maxsize=512)
+def _sampling_table(year, gender, version=''):
+    """
+    Build the sampling table for one year and gender on first use.
+
+    input:
+        year: int
+        gender: string ('m', 'f', or "" for both)
+        version: string, dataset version so tables are rebuilt after a data refresh
+    output:
+        tuple of (array of names, births array, cumulative births array),
+        sorted from most to fewest births
+    """
+    index = name_index.load_index()
+    if index is not None and index.first_year <= year <= index.last_year:
+        # the index already lists each year's names per sex sorted by births
+        sexes = [gender.upper()] if gender else name_index.SEXES
+        ids = np.concatenate([np.asarray(index.ranked_ids(year, sex), dtype=np.int64)
+                              for sex in sexes])
+        births = np.asarray(index.births[ids, year - index.first_year], dtype=np.int64)
+        if not gender:
+            order = np.argsort(-births, kind='stable')
+            ids, births = ids[order], births[order]
+        year_names = index.names[ids]
+    else:
+        file_path = os.path.join(name_index.DATA_DIR, f'yob{year}.txt')
+        records = name_index.read_year_file(file_path)
+        if gender:
+            records = [r for r in records if r[1] == gender.upper()]
+        births = np.array([r[2] for r in records], dtype=np.int64)
+        order = np.argsort(-births, kind='stable')
+        year_names = np.array([r[0] for r in records], dtype=object)[order]
+        births = births[order]
+
+    return year_names, births, np.cumsum(births)
+
+
+@functools.lru_cache(maxsize=256)
+def _draw_years(gender, start_year, end_year, top, min_births, version=''):
+    """
+    Find the years random names can be drawn from with the given filters
+    and how many of each year's most popular names qualify.
 
     input:
+        gender: string ('m', 'f', or "" for both)
+        start_year, end_year: int or None, inclusive year range
+        top: int or None, only the top names of each year
+        min_births: int or None, only names given at least this many times in the year
+        version: string, dataset version
+    output:
+        tuple of (array of years, array of name counts per year or None for every name)
+    """
+    years = np.array([year for year in _available_years(version)
+                      if (start_year is None or year >= start_year)
+                      and (end_year is None or year <= end_year)], dtype=np.int64)
+    if top is None and not min_births:
+        return years, None
+
+    limits = np.empty(years.size, dtype=np.int64)
+    for i, year in enumerate(years):
+        births = _sampling_table(int(year), gender, version)[1]
+        limit = births.size if top is None else min(top, births.size)
+        if min_births:
+            # births are sorted in descending order
+            limit = min(limit, np.searchsorted(-births, -min_births, side='right'))
+        limits[i] = limit
+    keep = limits > 0
+    return years[keep], limits[keep]
+
+
+def random_names(n, gender="", surname=False, weighted=False, rng=None, seed=None,
+                 start_year=None, end_year=None, top=None, min_births=None):
+    """
+    Generate n random names in one pass with options to
+    specify gender, generate random surnames, weight
+    names by their number of births, and limit the years and
+    popularity of the names drawn.
+
+    Every call draws from its own Generator, so concurrent requests share no
+    random state, and the same seed gives the same names for the same dataset.
+    Each name comes from a random year with data, and the filters only cut
+    that year's births-sorted table short, so filtered draws cost the same
+    as unfiltered ones.
+
+    input:
+        n: int
         gender: string ('m' or 'f'); default empty string ""
         surname: boolean; default False
+        weighted: boolean; default False (every distinct name is equally likely);
+            also applies to surnames
+        rng: numpy Generator; default new Generator seeded with seed
+        seed: int, makes the names reproducible; default None (random)
+        start_year, end_year: int, inclusive range of years to draw from;
+            default None (the first or last year with data)
+        top: int, only draw from the top names of each year; default None (all)
+        min_births: int, only draw names given at least this many times in
+            their year; default None
     output:
-        string: random first and/or last name(s)
+        list of strings: random first and/or last names
+    raises:
+        ValueError if the gender is not 'm', 'f', or "", or no names match the filters
+    """
+    gender = gender.lower()
+    if gender not in ('', 'm', 'f'):
+        raise ValueError("Choose a gender of 'm' or 'f', or leave it empty for any gender.")
+    rng = rng or np.random.default_rng(seed)
+    version = name_index.dataset_version()
+    years, limits = _draw_years(gender, start_year, end_year, top, min_births, version)
+    if not years.size:
+        raise ValueError("No names match the selected years and popularity filters.")
+
+    slots_by_year = rng.integers(years.size, size=n)
+    first_names = np.empty(n, dtype=object)
+
+    # draw every name that shares a year from that year's table at once
+    for i in np.unique(slots_by_year):
+        slots = np.flatnonzero(slots_by_year == i)
+        year_names, _, cumulative = _sampling_table(int(years[i]), gender, version)
+        limit = year_names.size if limits is None else limits[i]
+        if weighted:
+            draws = rng.integers(cumulative[limit - 1], size=slots.size)
+            picks = np.searchsorted(cumulative, draws, side='right')
+        else:
+            picks = rng.integers(limit, size=slots.size)
+        first_names[slots] = year_names[picks]
+
+    full_names = first_names.tolist()
+    if surname:
+        surnames = random_surnames(n, weighted, rng)
+        full_names = [f"{first} {last}" for first, last in zip(full_names, surnames)]
+    return full_names
+
+
+def chunk_rng(entropy, index):
+    """
+    Return the random number generator for one chunk of a large generation run.
+    Chunk seeds are spawned from one SeedSequence, so every chunk gets an
+    independent stream and a run is reproducible from its entropy alone,
+    however the chunks are spread across processes.
+
+    input:
+        entropy: int, SeedSequence entropy of the whole run
+        index: int, chunk number
+    output:
+        numpy Generator
     """
-    year = str(random.randrange(1880, 2020))
-    file_name = f'names_files/yob{year}.txt'
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(index,)))
 
-    with open(file_name, 'r', encoding='utf-8-sig') as file:
-        lines = file.readlines()
 
-    if gender:
-        lines = [line for line in lines if line.split(
-            ',')[1].lower() == gender.lower()]
+def iter_random_names(n, gender="", surname=False, weighted=False, seed=None,
+                      chunk_size=10000, **filters):
+    """
+    Generate n random names in chunks, so memory use does not grow with n.
 
-    cur_line = random.choice(lines)
-    name_details = cur_line.strip().split(',')
-    full_name = name_details[0]
+    input:
+        n: int
+        gender, surname, weighted: see random_names()
+        seed: int; default None (fresh entropy)
+        chunk_size: int, names per chunk
+        filters: start_year, end_year, top, and min_births; see random_names()
+    output:
+        generator of lists of up to chunk_size names
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    for index, start in enumerate(range(0, n, chunk_size)):
+        yield random_names(min(chunk_size, n - start), gender, surname, weighted,
+                           rng=chunk_rng(entropy, index), **filters)
+
+
+def random_name(gender="", surname=False, seed=None):
+    """
+    Generate random name with options to 
+    specify gender and generate random surname.
+
+    input:
+        gender: string ('m' or 'f'); default empty string ""
+        surname: boolean; default False
+        seed: int, makes the name reproducible; default None (random)
+    output:
+        string: random first and/or last name(s)
+    """
+    return random_names(1, gender, surname, seed=seed)[0]
 
-    if surname:
-        sur = random_surname()
-        full_name += f" {sur}"
 
-    return full_name
+NAMEBERRY_HEADERS = {
+    'User-Agent':
+        'Mozilla/5.0 (Windows NT 6.1; WOW64)' +
+    ' AppleWebKit/537.36 (KHTML, like Gecko)'
+        + ' Chrome/56.0.2924.76 Safari/537.36'
+}
 
 
+@cached('nameberry')
 def get_name_meaning(name, gender):
     """
     Scrape NameBerry for the origin and meaning
@@ -129,25 +540,38 @@ def get_name_meaning(name, gender):
         string containing scraped name meaning or error message
     """
     name = name.capitalize()
-    headers = {
-        'User-Agent':
-            'Mozilla/5.0 (Windows NT 6.1; WOW64)' +
-        ' AppleWebKit/537.36 (KHTML, like Gecko)'
-            + ' Chrome/56.0.2924.76 Safari/537.36'
-    }
 
     try:
-        r = requests.get("https://nameberry.com/b/" + gender + '-baby-name-' +
-                         name, headers=headers, timeout=10)
+        r = http_client.get(_nameberry_url(name, gender),
+                            headers=NAMEBERRY_HEADERS, timeout=10)
         r.raise_for_status()
     except requests.exceptions.Timeout:
         return "The request timed out."
-    except requests.exceptions.HTTPError:
-        return f"Error: No information found on NameBerry for {name}"
+    except requests.exceptions.HTTPError as e:
+        # only a missing page means NameBerry has no data; other statuses are
+        # transient failures and must not be cached as "no information"
+        status = e.response.status_code if e.response is not None else None
+        if status == 404:
+            return f"Error: No information found on NameBerry for {name}"
+        return f"NameBerry is unavailable right now (HTTP {status})."
     except requests.exceptions.RequestException as e:
         return f"An error occurred while making the request: {e}"
 
-    soup = BeautifulSoup(r.text, 'html.parser')
+    return _parse_name_meaning(r.text, name)
+
+
+def _nameberry_url(name, gender):
+    """
+    Build the NameBerry page URL for a capitalized name and 'boy' or 'girl'.
+    """
+    return "https://nameberry.com/b/" + gender + '-baby-name-' + name
+
+
+def _parse_name_meaning(html, name):
+    """
+    Extract the origin and meaning paragraphs from a NameBerry page.
+    """
+    soup = bs4.BeautifulSoup(html, 'html.parser')
     meaning = soup.find_all('div', {"class": "t-copy"})
 
     meaning_text = (
@@ -160,6 +584,7 @@ def get_name_meaning(name, gender):
     return meaning_text
 
 
+@cached('nationalize')
 def nationalize(name):
     """
     Use nationalize.io API to predict nationality of a given name (recommended to use last names).
@@ -170,7 +595,7 @@ def nationalize(name):
         string containing predicted nationalities or error message
     """
     try:
-        response = requests.get(
+        response = http_client.get(
             f"https://api.nationalize.io?name={name}", timeout=10)
         response.raise_for_status()
     except requests.exceptions.Timeout:
@@ -181,12 +606,31 @@ def nationalize(name):
     except requests.exceptions.RequestException as e:
         return f"An error occurred (Nationalize API): {e}"
 
-    nationalities = response.json().get('country', [])
+    return _parse_nationalize(response.json())
+
+
+def _parse_nationalize(data):
+    """
+    Extract the predicted nationalities from one Nationalize API result.
+    """
+    nationalities = data.get('country', [])
     if not nationalities:
         return "Error: No nationality data available."
     return nationalities
 
 
+@functools.lru_cache(maxsize=1)
+def country_table():
+    """
+    Build a table of every ISO 3166-1 country, once per process.
+
+    output:
+        dictionary mapping alpha-2 code to a tuple of (numeric code, full country name)
+    """
+    return {country.alpha_2: (country.numeric, country.name)
+            for country in pycountry.countries}
+
+
 def get_country_codes(nationalities):
     """
     Format Nationalize API results to contain full country names.
@@ -202,8 +646,8 @@ def get_country_codes(nationalities):
         country_code = country.get('country_id')
         probability = country.get('probability')
         if country_code and probability is not None:
-            cur_country = pycountry.countries.get(alpha_2=country_code)
-            country_name = cur_country.name if cur_country else country_code
+            _, country_name = country_table().get(
+                country_code.upper(), (None, country_code))
             country_info = {
                 'country_name': country_name,
                 'probability': probability
@@ -213,17 +657,19 @@ def get_country_codes(nationalities):
     return nationalities_info
 
 
-def get_formatted_nationality(last_name):
+def get_formatted_nationality(last_name=None, predictions=None):
     """
     Predict nationality using the nationalize() function and 
     format the output to display on user interface.
 
     input:
         last_name: string
+        predictions: output of nationalize() if already fetched; default None
     output:
         list containing formatted nationality predictions or error message as tuples
     """
-    nationalize_output = nationalize(last_name)
+    nationalize_output = nationalize(
+        last_name) if predictions is None else predictions
 
     # check if output is error
     if not isinstance(nationalize_output, list):
@@ -238,6 +684,7 @@ def get_formatted_nationality(last_name):
     return nationalize_tuples
 
 
+@cached('genderize')
 def genderize(name):
     """
     Use genderize.io API to predict the gender of a given name.
@@ -250,7 +697,7 @@ def genderize(name):
     """
 
     try:
-        response = requests.get(
+        response = http_client.get(
             f"https://api.genderize.io?name={name}", timeout=10)
         response.raise_for_status()
     except requests.exceptions.Timeout:
@@ -260,13 +707,20 @@ def genderize(name):
     except requests.exceptions.RequestException as e:
         return f"An error occurred (Genderize API): {e}"
 
-    data = response.json()
+    return _parse_genderize(response.json())
+
+
+def _parse_genderize(data):
+    """
+    Extract the predicted gender and probability from one Genderize API result.
+    """
     gender = data.get('gender', 'unknown')
     probability = data.get('probability', 0) * 100
 
     return (gender, round(probability, 2))
 
 
+@cached('agify')
 def agify(name):
     """
     Use agify.io API to predict age of a given name.
@@ -277,7 +731,7 @@ def agify(name):
         string containing predicted age or error message
     """
     try:
-        response = requests.get(
+        response = http_client.get(
             f"https://api.agify.io?name={name}", timeout=10)
         response.raise_for_status()
     except requests.exceptions.HTTPError as e:
@@ -287,47 +741,256 @@ def agify(name):
     except requests.exceptions.RequestException as e:
         return f"An error occurred (Agify API): {e}"
 
-    data = response.json()
+    return _parse_agify(response.json())
+
+
+def _parse_agify(data):
+    """
+    Extract the predicted age from one Agify API result.
+    """
     age = data.get('age', 'unknown')
 
     return age
 
 
+# the Nationalize, Genderize, and Agify APIs accept at most 10 names per request
+BATCH_SIZE = 10
+
+
+def _batch_lookup(source, url, label, parse, names_list):
+    """
+    Look up several names with the multi-name form of an API
+    (name[]=...&name[]=...), using cached answers where available.
+
+    input:
+        source: string, cache source name
+        url: string, API URL
+        label: string, API name used in error messages
+        parse: function converting one API result to the single-name output
+        names_list: list of strings
+    output:
+        list of results in the same order as names_list; names whose
+        request failed get that request's error message
+    """
+    results = [None] * len(names_list)
+    pending = {}
+    for position, name in enumerate(names_list):
+        hit, value = response_cache.get(source, cache_key(source, (name,)))
+        if hit:
+            results[position] = value
+        else:
+            pending.setdefault(name.strip().lower(), []).append(position)
+
+    keys = list(pending)
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        try:
+            response = http_client.get(
+                url, params=[('name[]', name) for name in chunk], timeout=10)
+            response.raise_for_status()
+            chunk_values = [parse(data) for data in response.json()]
+            if len(chunk_values) != len(chunk):
+                raise ValueError(
+                    f"expected {len(chunk)} results, got {len(chunk_values)}")
+        except requests.exceptions.Timeout:
+            chunk_values = [f"The request to the {label} API timed out."] * len(chunk)
+        except requests.exceptions.HTTPError as e:
+            chunk_values = [f"HTTP error occurred: {e}"] * len(chunk)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            chunk_values = [f"An error occurred ({label} API): {e}"] * len(chunk)
+
+        # results come back in the same order as the names were sent
+        for key, value in zip(chunk, chunk_values):
+            ttl = ttl_for(source, value)
+            if ttl is not None:
+                response_cache.set(source, cache_key(source, (key,)), value, ttl)
+            for position in pending[key]:
+                results[position] = value
+    return results
+
+
+def nationalize_batch(names_list):
+    """
+    Use nationalize.io API to predict the nationalities of several names,
+    sending up to 10 names per request.
+
+    input:
+        names_list: list of strings
+    output:
+        list with one nationalize() result per name, in input order
+    """
+    return _batch_lookup('nationalize', "https://api.nationalize.io",
+                         'Nationalize', _parse_nationalize, names_list)
+
+
+def genderize_batch(names_list):
+    """
+    Use genderize.io API to predict the genders of several names,
+    sending up to 10 names per request.
+
+    input:
+        names_list: list of strings
+    output:
+        list with one genderize() result per name, in input order
+    """
+    return _batch_lookup('genderize', "https://api.genderize.io",
+                         'Genderize', _parse_genderize, names_list)
+
+
+def agify_batch(names_list):
+    """
+    Use agify.io API to predict the ages of several names,
+    sending up to 10 names per request.
+
+    input:
+        names_list: list of strings
+    output:
+        list with one agify() result per name, in input order
+    """
+    return _batch_lookup('agify', "https://api.agify.io",
+                         'Agify', _parse_agify, names_list)
+
+
+def name_information(first_name, last_name, gender, deadline=LOOKUP_DEADLINE):
+    """
+    Run the NameBerry, Nationalize, Genderize, and Agify lookups in parallel
+    with one overall deadline. Lookups that fail or are still pending at the
+    deadline are reported as error messages; the others are returned as usual.
+
+    input:
+        first_name: string
+        last_name: string
+        gender: string, 'boy' or 'girl'
+        deadline: float, seconds to wait for all lookups
+    output:
+        dictionary with 'name_meaning', 'nationalize', 'genderize', and 'agify' results
+        and the raw Nationalize output as 'nationality_predictions'
+    """
+    lookups = {
+        'name_meaning': (get_name_meaning, first_name, gender),
+        'nationality_predictions': (nationalize, last_name),
+        'genderize': (genderize, first_name),
+        'agify': (agify, first_name),
+    }
+    futures = {key: _lookup_pool.submit(func, *args)
+               for key, (func, *args) in lookups.items()}
+    wait(futures.values(), timeout=deadline)
+
+    results = {}
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            message = "The request timed out."
+        elif future.exception() is not None:
+            message = f"An error occurred: {future.exception()}"
+        else:
+            results[key] = future.result()
+            continue
+        results[key] = message
+
+    # format the single Nationalize response for display
+    results['nationalize'] = get_formatted_nationality(
+        predictions=results['nationality_predictions'])
+    return results
+
+
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_SEARCH_URL = "https://api.spotify.com/v1/search"
+# refresh the access token this many seconds before it expires
+SPOTIFY_TOKEN_MARGIN = 60
+
+
+class SpotifyToken:
+    """
+    Thread-safe cache of a Spotify client-credentials access token.
+    The token is reused until shortly before it expires, and only one
+    thread requests a new token when it does.
+    """
+
+    def __init__(self, client_id=None, client_secret=None):
+        self.client_id = client_id or os.environ.get('SPOTIFY_CLIENT_ID', '')
+        self.client_secret = client_secret or os.environ.get(
+            'SPOTIFY_CLIENT_SECRET', '')
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self):
+        return self._token is not None and time.monotonic() < self._expires_at
+
+    def get(self):
+        """
+        Return a valid access token, requesting a new one if needed.
+
+        output:
+            tuple of (token or None, error message or None)
+        """
+        if self._is_fresh():
+            return self._token, None
+
+        with self._lock:
+            # another thread may have refreshed the token while we waited
+            if self._is_fresh():
+                return self._token, None
+
+            if not (self.client_id and self.client_secret):
+                return None, ("Spotify credentials are not configured "
+                              "(set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET).")
+
+            # Make POST request to retrieve access token to Spotify API
+            try:
+                response = http_client.post(SPOTIFY_TOKEN_URL,
+                                            data={"grant_type": "client_credentials"},
+                                            auth=requests.auth.HTTPBasicAuth(
+                                                self.client_id, self.client_secret),
+                                            timeout=10)
+                response.raise_for_status()
+            except requests.exceptions.Timeout:
+                return None, "The request timed out."
+            except requests.exceptions.RequestException as e:
+                return None, f"An error occurred while requesting token: {e}"
+
+            data = response.json()
+            token = data.get('access_token')
+            if not token:
+                return None, "Unable to retrieve access token from Spotify API."
+
+            expires_in = data.get('expires_in', 3600)
+            self._token = token
+            self._expires_at = time.monotonic() + max(
+                expires_in - SPOTIFY_TOKEN_MARGIN, 0)
+            return token, None
+
+    def invalidate(self):
+        """
+        Forget the cached token, e.g. after Spotify rejects it.
+        """
+        with self._lock:
+            self._token = None
+
+
+spotify_token = SpotifyToken()
+
+
+@cached('spotify')
 def spotify_track(name):
     """
     Retrieve data for first track that matches a given name on Spotify.
     Example: 'Rhiannon' -> 'Rhiannon' by Fleetwood Mac
 
+    Credentials are read from the SPOTIFY_CLIENT_ID and
+    SPOTIFY_CLIENT_SECRET environment variables.
+
     input:
         name: string
     output: 
         dictionary of strings (track name, artist name, Spotify URL)
     """
-
-    # ** Add client credentials here **
-    client_id = 'YOUR_CLIENT_ID'
-    client_secret = 'YOUR_CLIENT_SECRET'
-
-    token_url = "https://accounts.spotify.com/api/token"
-
-    # Make POST request to retrieve access token to Spotify API
-    try:
-        response = requests.post(token_url,
-                                 data={"grant_type": "client_credentials"},
-                                 auth=HTTPBasicAuth(client_id, client_secret), timeout=10)
-        response.raise_for_status()
-    except requests.exceptions.Timeout:
-        return "The request timed out."
-    except requests.exceptions.RequestException as e:
-        return f"An error occurred while requesting token: {e}"
-
-    token = response.json().get('access_token')
-
-    if not token:
-        return "Error: Unable to retrieve access token from Spotify API."
+    token, error = spotify_token.get()
+    if error:
+        return error
 
     # Make GET request for first track that matches name
-    search_url = "https://api.spotify.com/v1/search"
     search_headers = {
         "Authorization": f"Bearer {token}"
     }
@@ -338,18 +1001,28 @@ def spotify_track(name):
     }
 
     try:
-        search_response = requests.get(
-            search_url, headers=search_headers, params=search_params, timeout=10)
+        search_response = http_client.get(
+            SPOTIFY_SEARCH_URL, headers=search_headers, params=search_params, timeout=10)
+        if search_response.status_code == 401:
+            spotify_token.invalidate()
         search_response.raise_for_status()
     except requests.exceptions.Timeout:
         return "The request timed out."
     except requests.exceptions.RequestException as e:
         return f"An error occurred during search: {e}"
 
-    search_results = search_response.json()
+    return _parse_spotify_track(search_response.json(), name)
 
+
+def _parse_spotify_track(search_results, name):
+    """
+    Extract the first track's name, artist, and URL from a Spotify search result.
+    """
     # Get track name, artist, and Spotify URL from the search results
-    items = search_results['tracks']['items'][0]
+    tracks = search_results.get('tracks', {}).get('items', [])
+    if not tracks:
+        return f"Error: No Spotify track found for {name}."
+    items = tracks[0]
 
     track_data = {
         "track_name": items['name'],
@@ -0,0 +1,161 @@
+"""
+Helpers for starting the web app quickly.
+
+- lazy_import() returns a module that is only loaded the first time one of
+  its attributes is used, so heavy dependencies (pandas, altair, BeautifulSoup,
+  pycountry, requests) stay out of worker boot until a route needs them.
+- prewarm() loads those dependencies and the name data ahead of time; call it
+  from gunicorn's when_ready hook (see gunicorn.conf.py) so workers forked
+  from a preloaded app start with everything in memory.
+- Run `python startup.py` for a report of how long each module takes to
+  import when the app starts.
+"""
+import os
+import re
+import sys
+import time
+import types
+import argparse
+import importlib
+import threading
+import subprocess
+import importlib.util
+
+# seconds taken to load each lazily imported module on first use
+LOAD_TIMES = {}
+
+# one stand-in per lazily imported module, shared by every importer
+_lazy_modules = {}
+_lazy_modules_lock = threading.Lock()
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that imports it on first attribute access.
+
+    importlib.util.LazyLoader is not thread-safe before Python 3.12.3: threads
+    touching a lazy module at the same time can see it half-initialised. Here
+    the first load is serialised with a lock and every attribute is read from
+    the fully imported module.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with self.__dict__['_lock']:
+                module = self.__dict__['_module']
+                if module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    LOAD_TIMES[self.__name__] = time.perf_counter() - start
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        # only called for attributes the stand-in doesn't have itself
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """
+    Import a module lazily: it is loaded the first time one of its attributes is used.
+
+    input:
+        name: string, full module name (e.g. 'pandas')
+    output:
+        module object; the already loaded module if it was imported before
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    with _lazy_modules_lock:
+        if name not in _lazy_modules:
+            if importlib.util.find_spec(name) is None:
+                raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+            _lazy_modules[name] = _LazyModule(name)
+        return _lazy_modules[name]
+
+
+def prewarm():
+    """
+    Load heavy dependencies and name data so the first requests are fast.
+
+    output:
+        dictionary mapping each step to the seconds it took
+    """
+    # imported here so this module stays cheap to import from gunicorn.conf.py
+    import names
+    import name_index
+    import name_search
+    import visualizations
+
+    steps = {
+        'pandas': lambda: names.pd.DataFrame,
+        'altair': lambda: visualizations.alt.Chart,
+        'bs4': lambda: names.bs4.BeautifulSoup,
+        'requests': lambda: names.requests.adapters.HTTPAdapter,
+        'country_table': names.country_table,
+        'name_index': name_index.load_index,
+        'name_search': lambda: name_index.load_index() and name_search.get_search(),
+    }
+    timings = {}
+    for step, run in steps.items():
+        start = time.perf_counter()
+        run()
+        timings[step] = time.perf_counter() - start
+    return timings
+
+
+def import_report(module='app', limit=20):
+    """
+    Measure how long each module takes to import by importing `module`
+    in a fresh interpreter with `python -X importtime`.
+
+    input:
+        module: string, module to import; default 'app'
+        limit: int, number of slowest modules to return; default 20
+    output:
+        list of (module name, own seconds, cumulative seconds), slowest cumulative first
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)) / 1e6,
+                         int(match.group(2)) / 1e6))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--module', default='app', help="module to import (default: app)")
+    parser.add_argument('--limit', type=int, default=20,
+                        help="number of slowest modules to show (default: 20)")
+    parser.add_argument('--prewarm', action='store_true',
+                        help="also time each prewarm() step")
+    args = parser.parse_args(argv)
+
+    print(f"{'module':<50} {'self ms':>10} {'total ms':>10}")
+    for name, own, cumulative in import_report(args.module, args.limit):
+        print(f"{name:<50} {own * 1000:>10.1f} {cumulative * 1000:>10.1f}")
+
+    if args.prewarm:
+        print(f"\n{'prewarm step':<50} {'ms':>10}")
+        for step, seconds in prewarm().items():
+            print(f"{step:<50} {seconds * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+// Suggest names from /autocomplete for every input with a data-autocomplete attribute.
+// Suggestions are shown through the <datalist> named in the input's list attribute.
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+  var datalist = document.getElementById(input.getAttribute('list'));
+  var timer = null;
+
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    // only complete the first name of a full name
+    var query = input.value.trim();
+    if (!query || query.indexOf(' ') !== -1) {
+      datalist.innerHTML = '';
+      return;
+    }
+    timer = setTimeout(function () {
+      fetch('/autocomplete?q=' + encodeURIComponent(query))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          datalist.innerHTML = '';
+          data.matches.forEach(function (name) {
+            var option = document.createElement('option');
+            option.value = name;
+            datalist.appendChild(option);
+          });
+        });
+    }, 150);
+  });
+});
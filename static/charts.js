@@ -0,0 +1,56 @@
+// Render the static Vega-Lite chart templates in static/specs/ with data
+// from the JSON API. Each template reads a named dataset that is filled in here.
+
+function embedTemplate(selector, specUrl, datasets, prepare) {
+  return fetch(specUrl)
+    .then(function (response) { return response.json(); })
+    .then(function (spec) {
+      spec.datasets = datasets;
+      if (prepare) {
+        prepare(spec);
+      }
+      return vegaEmbed(selector, spec);
+    });
+}
+
+function quantile(values, q) {
+  var sorted = values.slice().sort(function (a, b) { return a - b; });
+  var position = (sorted.length - 1) * q;
+  var lower = Math.floor(position);
+  var upper = Math.ceil(position);
+  return sorted[lower] + (sorted[upper] - sorted[lower]) * (position - lower);
+}
+
+function renderPopularityCharts(apiUrl, specUrls) {
+  return fetch(apiUrl)
+    .then(function (response) { return response.json(); })
+    .then(function (data) {
+      var births = data.series[0].births;
+      var rows = births.map(function (count, i) {
+        return {Year: data.start_year + i, Births: count};
+      });
+      var datasets = {popularity: rows};
+      var threshold = rows.length ? quantile(births, 0.85) : 0;
+
+      embedTemplate('#viz1', specUrls.line, datasets);
+      embedTemplate('#viz2', specUrls.heatmap, datasets, function (spec) {
+        // darker cells get white labels
+        spec.params.forEach(function (param) {
+          if (param.name === 'threshold') {
+            param.value = threshold;
+          }
+        });
+      });
+    });
+}
+
+function renderNationalityMap(selector, specUrl, rows, topologyUrl) {
+  return embedTemplate(selector, specUrl, {nationality: rows}, function (spec) {
+    // point both layers at the locally served world map
+    if (topologyUrl) {
+      spec.layer.forEach(function (layer) {
+        layer.data.url = topologyUrl;
+      });
+    }
+  });
+}
@@ -0,0 +1,21 @@
+"""
+Shared test set-up: a small synthetic SSA dataset (see benchmark.generate_data)
+in a temporary directory, so tests need no downloads. The data modules read
+NAMES_DATA_DIR when first imported, so it is set before any test imports them.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = tempfile.mkdtemp(prefix='names-tests-')
+os.environ['NAMES_DATA_DIR'] = DATA_DIR
+os.environ['NAMES_CACHE_DB'] = ''
+
+import benchmark  # noqa: E402
+import name_index  # noqa: E402
+
+benchmark.generate_data(DATA_DIR, first_year=2000, last_year=2005, names_per_year=50)
+name_index.build_index()
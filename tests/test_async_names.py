@@ -0,0 +1,62 @@
+import time
+import asyncio
+import pytest
+import http_client
+
+httpx = pytest.importorskip('httpx')
+import async_names  # noqa: E402
+
+
+def _run(retry_after, monkeypatch, max_retry_after=1):
+    """
+    Send one request to a mock host answering 429 with the given Retry-After.
+
+    output:
+        tuple of (response, number of upstream calls, seconds taken)
+    """
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(429, headers={'Retry-After': retry_after})
+
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', max_retry_after)
+    monkeypatch.setattr(async_names, '_client',
+                        httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def main():
+        start = time.monotonic()
+        try:
+            response = await async_names.get('http://upstream.test/')
+        finally:
+            await async_names.close()
+        return response, len(calls), time.monotonic() - start
+    return asyncio.run(main())
+
+
+def test_long_retry_after_is_not_waited_for(monkeypatch):
+    response, calls, elapsed = _run('60', monkeypatch)
+    assert response.status_code == 429
+    assert calls == 1
+    assert elapsed < 1
+
+
+def test_long_retry_after_date_is_not_waited_for(monkeypatch):
+    response, calls, _ = _run('Wed, 21 Oct 2099 07:28:00 GMT', monkeypatch)
+    assert response.status_code == 429
+    assert calls == 1
+
+
+def test_short_retry_after_is_retried(monkeypatch):
+    response, calls, _ = _run('0', monkeypatch)
+    assert response.status_code == 429
+    assert calls == http_client.RETRIES + 1
+
+
+def test_retry_delay_is_clamped(monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 2)
+    response = httpx.Response(429, headers={'Retry-After': '1.5'})
+    assert async_names._retry_delay(response, 0) == 1.5
+    assert async_names._retry_delay(httpx.Response(429, headers={'Retry-After': '5'}), 0) is None
+    # backoff without Retry-After is capped too
+    assert async_names._retry_delay(httpx.Response(503), 10) == 2
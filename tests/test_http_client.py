@@ -0,0 +1,76 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import http_client
+
+
+@pytest.fixture
+def server():
+    """
+    Local server answering 429 with the Retry-After value in server.retry_after.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            httpd.hits += 1
+            self.send_response(429)
+            self.send_header('Retry-After', httpd.retry_after)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.hits = 0
+    httpd.retry_after = '0'
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+
+
+def _url(httpd):
+    return f'http://127.0.0.1:{httpd.server_address[1]}/'
+
+
+def test_long_retry_after_is_not_waited_for(server, monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 1)
+    server.retry_after = '60'
+    session = http_client.create_session(retries=3, backoff_factor=0)
+    start = time.monotonic()
+    response = session.get(_url(server), timeout=1)
+    assert response.status_code == 429
+    assert server.hits == 1
+    assert time.monotonic() - start < 1
+
+
+def test_long_retry_after_date_is_not_waited_for(server, monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 1)
+    server.retry_after = 'Wed, 21 Oct 2099 07:28:00 GMT'
+    session = http_client.create_session(retries=3, backoff_factor=0)
+    response = session.get(_url(server), timeout=1)
+    assert response.status_code == 429
+    assert server.hits == 1
+
+
+def test_short_retry_after_is_retried(server, monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 1)
+    server.retry_after = '0'
+    session = http_client.create_session(retries=2, backoff_factor=0)
+    assert session.get(_url(server), timeout=1).status_code == 429
+    assert server.hits == 3
+
+
+def test_retry_after_is_clamped(monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 3)
+
+    class Response:
+        headers = {'Retry-After': '2'}
+
+        def getheader(self, name):
+            return self.headers.get(name)
+
+    retry = http_client.retry_class()(total=1)
+    assert retry.get_retry_after(Response()) == 2
+    monkeypatch.setattr(http_client, 'MAX_RETRY_AFTER', 1)
+    assert retry.get_retry_after(Response()) == 1
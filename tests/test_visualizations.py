@@ -0,0 +1,34 @@
+import json
+import name_index
+import visualizations
+
+
+def _births(chart_json):
+    """
+    Return every Births value in a chart spec's inline datasets.
+    """
+    spec = json.loads(chart_json)
+    return [row['Births'] for rows in spec.get('datasets', {}).values()
+            for row in rows if 'Births' in row]
+
+
+def _popular_name():
+    index = name_index.load_index()
+    return str(index.names[index.ranked_ids(2005, 'f')[0]])
+
+
+def test_padded_name_does_not_cache_empty_chart():
+    name = _popular_name()
+    padded_line, _ = visualizations.popularity_charts_json(name + ' ', 'f', 2000, 2005)
+    line, heatmap = visualizations.popularity_charts_json(name, 'f', 2000, 2005)
+    assert any(_births(padded_line))
+    assert any(_births(line))
+    assert any(_births(heatmap))
+
+
+def test_padded_name_rank_chart():
+    name = _popular_name()
+    padded = visualizations.rank_chart_json(' ' + name + ' ', 'f', 2000, 2005)
+    assert padded == visualizations.rank_chart_json(name, 'f', 2000, 2005)
+    rows = [row for rows in json.loads(padded).get('datasets', {}).values() for row in rows]
+    assert rows
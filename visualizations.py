@@ -1,11 +1,28 @@
 """
 Create interactive data visualizations using name data.
+
+Finished popularity chart specs are cached as JSON, keyed on the normalized
+query and the dataset version, so repeat views skip pandas and Altair.
+Set NAMES_ALTAIR_VALIDATE=0 to skip Altair's schema validation when serializing.
 """
-import altair as alt
-from vega_datasets import data
-import pandas as pd
-import pycountry
+import os
 import names
+import name_index
+from cache import LRUCache
+from startup import lazy_import
+
+alt = lazy_import('altair')
+pd = lazy_import('pandas')
+
+CHART_CACHE_SIZE = int(os.environ.get('NAMES_CHART_CACHE_SIZE', 256))
+# entries are keyed on the dataset version, so they only expire to free memory
+CHART_CACHE_TTL = 24 * 60 * 60
+VALIDATE_CHARTS = os.environ.get('NAMES_ALTAIR_VALIDATE', '1') != '0'
+
+# world map topology served from static/, so maps render without the public CDN
+WORLD_TOPOLOGY_URL = '/static/world-110m.json'
+
+_chart_cache = LRUCache(CHART_CACHE_SIZE)
 
 
 def get_country_info(country_code):
@@ -18,35 +35,54 @@ def get_country_info(country_code):
     output:
         tuple of numeric country code and full country name or (None, None): (string, string)
     """
-    try:
-        country = pycountry.countries.get(alpha_2=country_code)
-        return country.numeric, country.name
-    except LookupError:
+    if not isinstance(country_code, str):
         return None, None
+    return names.country_table().get(country_code.upper(), (None, None))
+
+
+def nationality_rows(predictions):
+    """
+    Attach numeric country codes and full country names to Nationalize predictions.
+
+    input:
+        predictions: list output of names.nationalize()
+    output:
+        list of dictionaries with 'id' (numeric country code), 'country_id',
+        'country_name', and 'probability'; predictions for unknown countries are dropped
+    """
+    rows = []
+    for prediction in predictions:
+        country_id, country_name = get_country_info(prediction['country_id'])
+        if country_id:
+            rows.append({
+                'id': int(country_id),
+                'country_id': prediction['country_id'],
+                'country_name': country_name,
+                'probability': prediction['probability'],
+            })
+    return rows
 
 
-def create_nationalize_map(name):
+def create_nationalize_map(name=None, predictions=None, topology_url=WORLD_TOPOLOGY_URL):
     """
     Create a world map visualization that shows the predicted countries of origin
     of a given name.
 
     input:
         name: string
+        predictions: list output of names.nationalize() if already fetched; default None
+        topology_url: URL of the world TopoJSON file; default the copy in static/
     output:
         choropleth world map showcasing the five most probable countries of origin for a given name
     """
-    predictions = names.nationalize(name)
-
-    for prediction in predictions:
-        country_id, country_name = get_country_info(prediction['country_id'])
-        if country_id:
-            prediction['id'] = int(country_id)
-            prediction['country_name'] = country_name
+    if predictions is None:
+        predictions = names.nationalize(name)
 
-    # Filter the DataFrame to only keep entries with valid IDs
-    df = pd.DataFrame([p for p in predictions if 'id' in p])
+    # only keep entries with valid IDs
+    df = pd.DataFrame(nationality_rows(predictions),
+                      columns=['id', 'country_id', 'country_name', 'probability'])
 
-    countries_geojson = alt.topo_feature(data.world_110m.url, 'countries')
+    countries_geojson = alt.topo_feature(topology_url, 'countries')
 
     # World map background in grey
     world_map = alt.Chart(countries_geojson).mark_geoshape(
@@ -99,6 +135,57 @@ def simple_line_chart(df):
     return chart
 
 
+def multi_line_chart(df):
+    """
+    Create a line chart from a wide Pandas DataFrame that overlays
+    the frequency of several names over time.
+
+    input:
+        Pandas DataFrame containing a 'Year' column and
+        one column of births per name
+    output:
+        line chart with one colored line per name
+    """
+    name_columns = [col for col in df.columns if col != 'Year']
+    chart = alt.Chart(df).transform_fold(
+        name_columns, as_=['Name', 'Births']
+    ).mark_line(point=True).encode(
+        x=alt.X('Year:Q',
+                axis=alt.Axis(format='d', title='Year')),
+        y=alt.Y('Births:Q', title='Number of Births'),
+        color=alt.Color('Name:N', title='Name'),
+        tooltip=['Name:N', 'Year:Q', 'Births:Q']
+    ).properties(
+        width=800,
+        height=400
+    ).interactive(bind_x=True)
+    return chart
+
+
+def rank_chart(df):
+    """
+    Create a line chart from a Pandas DataFrame that visualizes the popularity rank of a name over time.
+
+    input:
+        Pandas DataFrame containing years, ranks, births, and shares of births
+        for a user-specified name
+    output:
+        line chart displaying the rank over the range of years, with rank 1 at the top
+    """
+    chart = alt.Chart(df).mark_line(point=True).encode(
+        x=alt.X('Year:Q',
+                axis=alt.Axis(format='d', title='Year')),
+        y=alt.Y('Rank:Q', title='Popularity Rank',
+                scale=alt.Scale(reverse=True, zero=False)),
+        tooltip=['Year:Q', 'Rank:Q', 'Births:Q',
+                 alt.Tooltip('Share:Q', title='Share of Births', format='.3%')]
+    ).properties(
+        width=800,
+        height=400
+    ).interactive(bind_x=True)
+    return chart
+
+
 def popularity_heatmap(df):
     """
     Create a heatmap from a Pandas DataFrame that visualizes the frequency of a name over time.
@@ -110,9 +197,6 @@ def popularity_heatmap(df):
         heatmap displaying the number of births over the range of years
         binned by decade
     """
-    df['Decade'] = (df['Year'] // 10) * 10
-    df['YearWithinDecade'] = df['Year'] % 10
-
     min_births = df['Births'].min()
     max_births = df['Births'].max()
     threshold = df['Births'].quantile(0.85)
@@ -121,7 +205,7 @@ def popularity_heatmap(df):
         bind=alt.binding_checkbox(name="Show grid and labels  "),
     )
 
-    heatmap = alt.Chart(df).mark_rect().encode(
+    heatmap = alt.Chart().mark_rect().encode(
         alt.X('YearWithinDecade:O', title='Year Within Decade',
               axis=alt.Axis(labelAngle=0)),
         alt.Y('Decade:O', title='Decade'),
@@ -133,13 +217,9 @@ def popularity_heatmap(df):
         # add grid outlines if toggled on
         stroke=alt.condition(
             select_checkbox, alt.value('black'), alt.value(None))
-    ).properties(
-        width=500,
-        height=300,
-        title='Heatmap of Births by Year Within Each Decade'
     )
 
-    text = alt.Chart(df).mark_text(align='center').encode(
+    text = alt.Chart().mark_text(align='center').encode(
         x='YearWithinDecade:O',
         y='Decade:O',
         text=alt.condition(select_checkbox, 'Births:Q',
@@ -152,5 +232,97 @@ def popularity_heatmap(df):
         select_checkbox
     )
 
-    heatmap += text
-    return heatmap
+    # both layers share one copy of the data; the decade fields are derived
+    # in the browser so the caller's DataFrame is left untouched
+    return alt.layer(
+        heatmap, text, data=df[['Year', 'Births']]
+    ).transform_calculate(
+        Decade='floor(datum.Year / 10) * 10',
+        YearWithinDecade='datum.Year % 10'
+    ).properties(
+        width=500,
+        height=300,
+        title='Heatmap of Births by Year Within Each Decade'
+    )
+
+
+def chart_to_json(chart):
+    """
+    Serialize a chart to compact Vega-Lite JSON, validating it against
+    the schema unless NAMES_ALTAIR_VALIDATE=0.
+    """
+    return chart.to_json(validate=VALIDATE_CHARTS, indent=None)
+
+
+def _cached_charts(key, build):
+    """
+    Return the cached result of build() for key, building and caching it on a miss.
+    """
+    key = key + (name_index.dataset_version(),)
+    hit, value = _chart_cache.get(key)
+    if not hit:
+        value = build()
+        _chart_cache.set(key, value, CHART_CACHE_TTL)
+    return value
+
+
+def popularity_charts_json(name, gender, start_year, end_year):
+    """
+    Return the line chart and heatmap JSON for a name's popularity.
+
+    input:
+        name: string
+        gender: string - 'm' for male or 'f' for female
+        start_year: int
+        end_year: int
+    output:
+        tuple of JSON strings (line chart, heatmap)
+    """
+    # the cache key and the lookup must see the same name
+    name = name.strip()
+
+    def build():
+        df = names.popularity(name, gender, start_year, end_year)
+        return (chart_to_json(simple_line_chart(df)),
+                chart_to_json(popularity_heatmap(df)))
+
+    key = ('popularity', name.lower(), gender.lower(), start_year, end_year)
+    return _cached_charts(key, build)
+
+
+def rank_chart_json(name, gender, start_year, end_year):
+    """
+    Return the rank history chart JSON for a name.
+
+    output:
+        JSON string
+    """
+    # the cache key and the lookup must see the same name
+    name = name.strip()
+
+    def build():
+        return chart_to_json(rank_chart(
+            names.rank_history(name, gender, start_year, end_year)))
+
+    key = ('rank', name.lower(), gender.lower(), start_year, end_year)
+    return _cached_charts(key, build)
+
+
+def comparison_chart_json(pairs, start_year, end_year):
+    """
+    Return the chart JSON overlaying the popularity of several names.
+
+    input:
+        pairs: list of (name, gender) tuples
+        start_year: int
+        end_year: int
+    output:
+        JSON string
+    """
+    def build():
+        return chart_to_json(multi_line_chart(
+            names.popularity_many(pairs, start_year, end_year)))
+
+    key = ('comparison', tuple((n.strip().lower(), g.lower()) for n, g in pairs),
+           start_year, end_year)
+    return _cached_charts(key, build)